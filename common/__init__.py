@@ -0,0 +1,4 @@
+"""
+Modules shared by both dashboards. Each exercise reaches this directory through
+its `common` symlink, the Docker images copy it next to the app.
+"""
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+# Plotly (>= 6) sends NumPy arrays to the browser as base64 typed arrays ("bdata")
+# instead of JSON lists of numbers: encoding is a memory copy and a float32 value
+# takes 4 bytes instead of ~18 characters. plotly.js has no int64 or datetime typed
+# arrays, Plotly would send those as JSON numbers and ISO date strings, so chart
+# series are converted to the types below before they are put in a figure.
+
+
+def chart_values(values) -> np.ndarray:
+    """
+    Values as a float32 array, ~7 significant digits are plenty for a chart.
+    """
+    return np.ascontiguousarray(values, dtype=np.float32)
+
+
+def chart_times(timestamps) -> np.ndarray:
+    """
+    Dates or int64 epoch milliseconds as float64 epoch milliseconds (exact for
+    any date a chart shows), for an x axis of type "date". Timezone-aware dates
+    keep their wall time, as they do when sent as strings.
+    """
+    if isinstance(getattr(timestamps, "dtype", None), pd.DatetimeTZDtype):
+        timestamps = pd.DatetimeIndex(timestamps).tz_localize(None)
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        timestamps = timestamps.astype("datetime64[ms]").astype(np.int64)
+    return np.ascontiguousarray(timestamps, dtype=np.float64)
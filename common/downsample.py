@@ -0,0 +1,106 @@
+import numpy as np
+
+# Plotly charts in the dashboard are roughly this wide on a laptop screen
+DEFAULT_WIDTH_PX = 1000
+# More than two points per horizontal pixel are not visible
+POINTS_PER_PIXEL = 2
+
+
+def max_points_for_width(width_px: int = DEFAULT_WIDTH_PX) -> int:
+    """
+    Number of points worth sending for a chart that is `width_px` pixels wide.
+    """
+    return width_px * POINTS_PER_PIXEL
+
+
+def _as_numbers(x) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def visible_slice(x, x_range=None) -> slice:
+    """
+    Slice of the sorted x values that falls inside x_range = (start, end),
+    with one extra point on each side so lines run to the edge of the chart.
+    """
+    if x_range is None:
+        return slice(0, len(x))
+    x = np.asarray(x)
+    start, end = np.asarray(x_range, dtype=x.dtype)
+    first = max(np.searchsorted(x, start, side="left") - 1, 0)
+    last = min(np.searchsorted(x, end, side="right") + 1, len(x))
+    return slice(first, last)
+
+
+def lttb(x, y, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indices of the
+    `threshold` points that best preserve the visual shape of the line.
+    Buckets are processed in order, each one with vectorized NumPy.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = _as_numbers(x)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges for the points between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        # Gaps (NaN) are never selected
+        selected = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def min_max(y, buckets: int) -> np.ndarray:
+    """
+    Min/max-per-bucket downsampling: keeps the lowest and highest point of each
+    of `buckets` equal buckets, fully vectorized. Returns sorted indices.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    size = n // buckets
+    usable = size * buckets
+    blocks = y[:usable].reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate(
+        [
+            offsets + np.nanargmin(blocks, axis=1),
+            offsets + np.nanargmax(blocks, axis=1),
+            np.arange(usable, n),  # Remainder that does not fill a bucket
+        ]
+    )
+    return np.unique(indices)
+
+
+def downsample(x, y, x_range=None, max_points=None, method="lttb") -> np.ndarray:
+    """
+    Indices of the points to plot: only the visible x_range, reduced to
+    max_points (default: two per pixel of a standard chart width).
+    """
+    max_points = max_points or max_points_for_width()
+    window = visible_slice(x, x_range)
+    x_visible = np.asarray(x)[window]
+    y_visible = np.asarray(y)[window]
+    if method == "minmax":
+        indices = min_max(y_visible, max_points // 2)
+    else:
+        indices = lttb(x_visible, y_visible, max_points)
+    return indices + window.start
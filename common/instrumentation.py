@@ -0,0 +1,305 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import streamlit as st
+
+# INSTRUMENTATION=1 records every run into process-wide metrics. Otherwise only
+# the runs of a session opened with ?debug=1 are recorded, for its own panel; when
+# off, spans and cache counters cost two flag checks per call
+_enabled = os.environ.get("INSTRUMENTATION", "0") == "1"
+# Optional file the metrics are written to after every run, in Prometheus text
+# format (e.g. for the node_exporter textfile collector) or JSON by extension
+EXPORT_PATH = os.environ.get("INSTRUMENTATION_EXPORT")
+
+_lock = threading.Lock()
+# Span name -> [count, total seconds, max seconds], over the process lifetime
+_span_stats = defaultdict(lambda: [0, 0.0, 0.0])
+# Cached function name -> {"calls": n, "misses": n}
+_cache_stats = defaultdict(lambda: {"calls": 0, "misses": 0})
+# Spans and cache counts of the run in progress and of the last finished run, and
+# whether the run in progress records, per script thread
+_local = threading.local()
+_DISABLED = nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _recording() -> bool:
+    return _enabled or getattr(_local, "recording", False)
+
+
+def _debugging() -> bool:
+    return st.query_params.get("debug") == "1"
+
+
+def _record(name: str, seconds: float):
+    if not _enabled:
+        return
+    with _lock:
+        stats = _span_stats[name]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+
+@contextmanager
+def _span(name: str):
+    trace = getattr(_local, "trace", None)
+    depth = getattr(_local, "depth", 0)
+    start = time.perf_counter()
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _local.depth = depth
+        _record(name, seconds)
+        if trace is not None:
+            trace.append((name, depth, start, seconds))
+
+
+def span(name: str):
+    """
+    Context manager timing a block under `name`.
+    """
+    return _span(name) if _recording() else _DISABLED
+
+
+def traced(function):
+    """
+    Decorator timing every call of the function as a span named module.function.
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _recording():
+            return function(*args, **kwargs)
+        with _span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def instrumented(cache_decorator):
+    """
+    Wraps a Streamlit cache decorator, e.g. @instrumented(st.cache_data(ttl=60)),
+    so every call is timed as a span and counted as a cache hit or miss. A miss is
+    a call that ran the function body.
+    """
+
+    def decorate(function):
+        name = f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def compute(*args, **kwargs):
+            if _recording():
+                _count(name, "misses")
+            return function(*args, **kwargs)
+
+        cached = cache_decorator(compute)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _recording():
+                return cached(*args, **kwargs)
+            _count(name, "calls")
+            with _span(name):
+                return cached(*args, **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+
+    return decorate
+
+
+def _count(name: str, counter: str):
+    caches = getattr(_local, "caches", None)
+    if caches is not None:
+        caches[name][counter] += 1
+    if _enabled:
+        with _lock:
+            _cache_stats[name][counter] += 1
+
+
+@contextmanager
+def run(name: str):
+    """
+    Records the spans and cache counts of one script run or fragment tick as the
+    last trace of the thread, when INSTRUMENTATION=1 or the session was opened
+    with ?debug=1. A run inside another run is recorded as a span of the outer one.
+    """
+    if not (_enabled or _debugging()):
+        yield
+        return
+    outer = (
+        getattr(_local, "trace", None),
+        getattr(_local, "depth", 0),
+        getattr(_local, "caches", None),
+        getattr(_local, "recording", False),
+    )
+    _local.trace, _local.depth = [], 0
+    _local.caches = defaultdict(lambda: {"calls": 0, "misses": 0})
+    _local.recording = True
+    try:
+        with _span(name):
+            yield
+    finally:
+        trace, caches = _local.trace, _local.caches
+        _local.last_trace, _local.last_caches = trace, caches
+        _local.trace, _local.depth, _local.caches, _local.recording = outer
+        if outer[0] is not None:
+            outer[0].append((name, outer[1], trace[-1][2], trace[-1][3]))
+            for function, stats in caches.items():
+                outer[2][function]["calls"] += stats["calls"]
+                outer[2][function]["misses"] += stats["misses"]
+        if _enabled and EXPORT_PATH:
+            export(EXPORT_PATH)
+
+
+def last_trace() -> list:
+    """
+    Spans of the last finished run of this thread as (name, depth, start, seconds),
+    in start order.
+    """
+    return sorted(getattr(_local, "last_trace", []), key=lambda span: span[2])
+
+
+def last_caches() -> dict:
+    """
+    Cached function name -> {"calls": n, "misses": n} of the last finished run of
+    this thread.
+    """
+    return {
+        name: dict(stats) for name, stats in getattr(_local, "last_caches", {}).items()
+    }
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "spans": {
+                name: {"count": count, "total_seconds": total, "max_seconds": peak}
+                for name, (count, total, peak) in _span_stats.items()
+            },
+            "caches": {name: dict(stats) for name, stats in _cache_stats.items()},
+        }
+
+
+def to_json() -> str:
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def to_prometheus() -> str:
+    """
+    Metrics in the Prometheus text exposition format.
+    """
+    metrics = snapshot()
+    lines = [
+        "# HELP dashboard_span_seconds Wall time of instrumented code.",
+        "# TYPE dashboard_span_seconds summary",
+    ]
+    for name, stats in sorted(metrics["spans"].items()):
+        lines.append(f'dashboard_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        lines.append(
+            f'dashboard_span_seconds_sum{{span="{name}"}} {stats["total_seconds"]:.6f}'
+        )
+    lines += [
+        "# HELP dashboard_span_max_seconds Slowest call of instrumented code.",
+        "# TYPE dashboard_span_max_seconds gauge",
+    ]
+    for name, stats in sorted(metrics["spans"].items()):
+        lines.append(
+            f'dashboard_span_max_seconds{{span="{name}"}} {stats["max_seconds"]:.6f}'
+        )
+    for counter in ("calls", "misses"):
+        lines += [
+            f"# HELP dashboard_cache_{counter}_total Cached function {counter}.",
+            f"# TYPE dashboard_cache_{counter}_total counter",
+        ]
+        for name, stats in sorted(metrics["caches"].items()):
+            lines.append(
+                f'dashboard_cache_{counter}_total{{function="{name}"}} {stats[counter]}'
+            )
+    return "\n".join(lines) + "\n"
+
+
+def export(path: str):
+    """
+    Write the metrics to `path` atomically, as JSON for a .json file and in the
+    Prometheus text format otherwise.
+    """
+    content = to_json() if path.endswith(".json") else to_prometheus()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def reset():
+    with _lock:
+        _span_stats.clear()
+        _cache_stats.clear()
+
+
+def debug_panel(container=None):
+    """
+    Opt-in profiling overlay, shown when the page is opened with ?debug=1: spans
+    and cache hit ratios of the last run of this session. The process-wide
+    metrics exports are only offered when INSTRUMENTATION=1.
+    """
+    if not _debugging():
+        return
+    container = container or st.sidebar
+    with container.expander("Performance", expanded=True):
+        trace = last_trace()
+        if trace:
+            st.write("Last run")
+            st.dataframe(
+                [
+                    {"span": "· " * depth + name, "ms": round(seconds * 1000, 2)}
+                    for name, depth, _, seconds in trace
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+        caches = last_caches()
+        if caches:
+            st.write("Caches")
+            st.dataframe(
+                [
+                    {
+                        "function": name,
+                        "calls": stats["calls"],
+                        "hit ratio": (
+                            f"{1 - stats['misses'] / stats['calls']:.0%}"
+                            if stats["calls"]
+                            else "-"
+                        ),
+                    }
+                    for name, stats in sorted(caches.items())
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+        if not _enabled:
+            return
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "Prometheus",
+                to_prometheus(),
+                file_name="metrics.prom",
+                use_container_width=True,
+            )
+        with col2:
+            st.download_button(
+                "JSON", to_json(), file_name="metrics.json", use_container_width=True
+            )
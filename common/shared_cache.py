@@ -0,0 +1,328 @@
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from common.instrumentation import span
+
+# SQLite file shared by every replica on one host (put it on a volume they all
+# mount), "" disables it. The default is next to each app's main.py: abspath keeps
+# the `common` symlink unresolved, so every exercise has its own file
+SHARED_CACHE_PATH = os.environ.get(
+    "SHARED_CACHE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ".shared_cache",
+        "cache.sqlite",
+    ),
+)
+# Least recently used entries are evicted past this total size
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", 512 * 2**20))
+# A hit records its access time only when the last one is older than this, so
+# reads of hot entries do not all take the write lock
+TOUCH_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    function TEXT NOT NULL,
+    format TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+"""
+
+
+# Values are stored without pickle, which would let anyone able to write the shared
+# volume run code in every replica: numbers, strings, lists, tuples and dicts with
+# string keys as a JSON manifest, the DataFrames and Series in them as Parquet parts
+# after it. Other values are refused with TypeError and not cached.
+_FORMAT = "manifest"
+_MANIFEST_SIZE = struct.Struct("<I")
+# What encoding an unsupported value or decoding a corrupt entry can raise
+_FORMAT_ERRORS = (
+    pa.ArrowException,
+    ValueError,
+    TypeError,
+    LookupError,
+    OSError,
+    struct.error,
+)
+
+
+def _encode(value, parts: list):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        items = [_encode(item, parts) for item in value]
+        return {"tuple": items} if isinstance(value, tuple) else items
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {"dict": {key: _encode(item, parts) for key, item in value.items()}}
+    if isinstance(value, pd.Series) and (
+        value.name is None or isinstance(value.name, str)
+    ):
+        buffer = io.BytesIO()
+        value.to_frame(name="value").to_parquet(buffer)
+        parts.append(buffer.getvalue())
+        return {"series": len(parts) - 1, "name": value.name}
+    if isinstance(value, pd.DataFrame):
+        buffer = io.BytesIO()
+        value.to_parquet(buffer)
+        parts.append(buffer.getvalue())
+        return {"frame": len(parts) - 1}
+    raise TypeError(f"{type(value).__name__} values are not stored in the shared cache")
+
+
+def _decode(value, parts: list):
+    if isinstance(value, list):
+        return [_decode(item, parts) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "tuple" in value:
+        return tuple(_decode(item, parts) for item in value["tuple"])
+    if "dict" in value:
+        return {key: _decode(item, parts) for key, item in value["dict"].items()}
+    if "series" in value:
+        frame = pd.read_parquet(io.BytesIO(parts[value["series"]]))
+        return frame["value"].rename(value["name"])
+    return pd.read_parquet(io.BytesIO(parts[value["frame"]]))
+
+
+def _serialize(value) -> tuple[str, bytes]:
+    parts = []
+    manifest = json.dumps(
+        {"value": _encode(value, parts), "parts": [len(part) for part in parts]}
+    ).encode()
+    return _FORMAT, b"".join([_MANIFEST_SIZE.pack(len(manifest)), manifest, *parts])
+
+
+def _deserialize(format: str, data: bytes):
+    if format != _FORMAT:
+        raise ValueError(f"Unknown shared cache format {format!r}")
+    (size,) = _MANIFEST_SIZE.unpack_from(data)
+    offset = _MANIFEST_SIZE.size + size
+    manifest = json.loads(data[_MANIFEST_SIZE.size : offset])
+    parts = []
+    for part_size in manifest["parts"]:
+        parts.append(data[offset : offset + part_size])
+        offset += part_size
+    return _decode(manifest["value"], parts)
+
+
+def _token(value) -> str:
+    """
+    Stable text of an argument, identical in every process (unlike hash()).
+    Arrays and pandas objects are reduced to a digest of their contents, other
+    types raise TypeError and the call is not cached.
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}({','.join(_token(item) for item in value)})"
+    if isinstance(value, dict):
+        items = sorted((_token(key), _token(item)) for key, item in value.items())
+        return f"dict({','.join(f'{key}:{item}' for key, item in items)})"
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return repr(pd.Timestamp(value))
+    if isinstance(value, np.generic):
+        return repr(value.item())
+    digest = hashlib.sha256()
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        labels = value.columns if isinstance(value, pd.DataFrame) else value.name
+        digest.update(repr(labels).encode())
+        # Hashes the index too, like st.cache_data
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    else:
+        raise TypeError(f"Cannot key the shared cache on {type(value).__name__}")
+    return f"{type(value).__name__}:{digest.hexdigest()}"
+
+
+class SQLiteCacheBackend:
+    """
+    Key-value store of serialized results in one SQLite file, safe to share
+    between the processes of one host. The WAL journal needs shared memory, so
+    the file must not be shared between hosts over a network filesystem. Entries
+    expire after their TTL and the least recently used ones (to TOUCH_INTERVAL)
+    are evicted past max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str):
+        """
+        Returns the stored value, or raises KeyError when missing, expired or
+        not decodable (the caller then overwrites it).
+        """
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT format, value, accessed_at FROM entries"
+            " WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        format, data, accessed_at = row
+        if now - accessed_at > TOUCH_INTERVAL:
+            try:
+                connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            except sqlite3.OperationalError:
+                pass  # Busy writers, the eviction order is only approximate anyway
+        try:
+            return _deserialize(format, data)
+        except _FORMAT_ERRORS:
+            raise KeyError(key) from None
+
+    def set(self, key: str, function: str, value, ttl: float):
+        format, data = _serialize(value)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, function, format, data, len(data), now + ttl, now),
+            )
+            connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            # Keep the most recently used entries that fit in max_bytes
+            connection.execute(
+                """
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS total
+                        FROM entries
+                    ) WHERE total > ?
+                )
+                """,
+                (self.max_bytes,),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self, function: str | None = None):
+        connection = self._connection()
+        if function is None:
+            connection.execute("DELETE FROM entries")
+        else:
+            connection.execute("DELETE FROM entries WHERE function = ?", (function,))
+
+
+_backends = {}
+
+
+def default_backend() -> SQLiteCacheBackend | None:
+    """
+    One backend per process for SHARED_CACHE_PATH, None when it is disabled.
+    """
+    if not SHARED_CACHE_PATH:
+        return None
+    if SHARED_CACHE_PATH not in _backends:
+        _backends[SHARED_CACHE_PATH] = SQLiteCacheBackend(SHARED_CACHE_PATH)
+    return _backends[SHARED_CACHE_PATH]
+
+
+def shared_cache(
+    ttl: float,
+    backend: SQLiteCacheBackend | None = None,
+    cache_if: Callable | None = None,
+):
+    """
+    Decorator caching results in a store shared by all replicas, used below
+    st.cache_data so the in-process cache is still checked first:
+
+        @st.cache_data
+        @shared_cache(ttl=3600)
+        def calculate(...):
+
+    Like st.cache_data, arguments starting with an underscore are not part of the
+    key. The key also covers the function source, so a deploy with changed code
+    does not read old results. `cache_if(value)` can exclude values (e.g. errors).
+    Any store failure, and arguments or results of a type the store does not
+    take, fall back to calling the function.
+    """
+
+    def decorate(function):
+        name = f"{function.__module__}.{function.__qualname__}"
+        signature = inspect.signature(function)
+        try:
+            source = inspect.getsource(function)
+        except (OSError, TypeError):
+            source = name
+        code_version = hashlib.sha256(source.encode()).hexdigest()[:16]
+
+        def make_key(args: tuple, kwargs: dict) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            tokens = [
+                f"{parameter}={_token(value)}"
+                for parameter, value in bound.arguments.items()
+                if not parameter.startswith("_")
+            ]
+            text = f"{name}|{code_version}|{'|'.join(tokens)}"
+            return hashlib.sha256(text.encode()).hexdigest()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            store = backend or default_backend()
+            if store is None:
+                return function(*args, **kwargs)
+            try:
+                key = make_key(args, kwargs)
+                with span("shared_cache.get"):
+                    return store.get(key)
+            except KeyError:
+                pass
+            except (sqlite3.Error, OSError, TypeError):
+                return function(*args, **kwargs)
+            value = function(*args, **kwargs)
+            if cache_if is None or cache_if(value):
+                try:
+                    with span("shared_cache.set"):
+                        store.set(key, name, value, ttl)
+                except (sqlite3.Error, *_FORMAT_ERRORS):
+                    pass
+            return value
+
+        return wrapper
+
+    return decorate
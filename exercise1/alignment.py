@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from common.instrumentation import instrumented
+from data import load_prices
+from metrics import TRADING_DAYS
+
+# Periods per year of a calendar that trades every day (crypto)
+CALENDAR_DAYS = 365
+# Fill policies for days on which some assets did not trade:
+# "ffill" keeps every day of the master calendar (union of the trading days) and
+# carries the last price forward, so a closed market has a zero return that day;
+# "intersection" keeps only the days on which every asset traded, returns then
+# span the closed days
+FILL_POLICIES = ("ffill", "intersection")
+# Longest gap filled by "ffill"; an asset without prices for longer is treated as
+# missing (e.g. suspended or delisted) and the rows are dropped
+MAX_FILL_DAYS = 7
+
+
+def infer_periods_per_year(dates):
+    """
+    Annualization factor of a calendar: 365 when it trades on weekends, else 252.
+    """
+    dates = pd.DatetimeIndex(dates)
+    if len(dates) == 0:
+        return TRADING_DAYS
+    weekend_share = (dates.dayofweek >= 5).mean()
+    # A fully 7-day calendar has 2/7 (~29%) weekend days
+    return CALENDAR_DAYS if weekend_share > 0.1 else TRADING_DAYS
+
+
+def align_prices(prices, policy="ffill"):
+    """
+    Aligns a wide price frame (dates x assets, union of their trading days) on one
+    master calendar with the fill policy. The calendar starts once every asset has
+    a price, so no asset silently contributes zero returns before it was listed.
+    """
+    if policy not in FILL_POLICIES:
+        raise ValueError(f"Unknown fill policy {policy!r}, use one of {FILL_POLICIES}")
+    prices = prices.sort_index()
+    if policy == "ffill":
+        prices = prices.ffill(limit=MAX_FILL_DAYS)
+    return prices.dropna(how="any")
+
+
+def returns_on_calendar(prices, calendar):
+    """
+    Returns of another price series (e.g. the benchmark) on an existing master
+    calendar: its price at each calendar close is the last one known by then, so
+    closed days have a zero return and no return is lost or counted twice.
+    """
+    calendar = pd.DatetimeIndex(calendar)
+    if calendar.empty:
+        return pd.Series(dtype=float, index=calendar)
+    prices = prices.sort_index()
+    union = prices.reindex(prices.index.union(calendar)).ffill(limit=MAX_FILL_DAYS)
+    # The last price before the calendar starts gives the return of its first day
+    previous = prices.index[prices.index < calendar[0]][-1:]
+    returns = union.reindex(previous.append(calendar)).pct_change(fill_method=None)
+    return returns.reindex(calendar)
+
+
+# Aligned returns matrix of an asset set, shared by the backtest, metrics and charts
+@instrumented(st.cache_data(show_spinner=True))
+def load_aligned_returns(assets, period, versions, policy="ffill"):
+    """
+    Returns a dict with the aligned daily returns (DataFrame, dates x assets) and
+    the annualization factor of the master calendar. `versions` (see
+    data.store_versions) is only part of the cache key: a top-up of any of the
+    assets gives a new entry.
+    """
+    prices = load_prices(assets, period)
+    aligned = align_prices(prices, policy)
+    returns = aligned.pct_change(fill_method=None).iloc[1:]
+    return {
+        "returns": returns.astype(np.float64),
+        "periods_per_year": infer_periods_per_year(returns.index),
+    }
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from metrics import TRADING_DAYS
+
+# Rebalancing schedules: label shown in the UI -> code used by backtest()
+REBALANCING = {
+    "Daily": "D",
+    "Monthly": "M",
+    "Quarterly": "Q",
+    "Annually": "A",
+    "Threshold band": "band",
+    "Buy and hold": "none",
+}
+# Calendar codes -> pandas period frequency
+CALENDAR_FREQUENCIES = {"M": "M", "Q": "Q", "A": "Y"}
+# Days looked ahead at once when searching for the next threshold breach
+BAND_LOOKAHEAD = 256
+
+
+def calendar_rebalance_points(dates, frequency):
+    """
+    Positions of the first day of every new month/quarter/year. The portfolio is
+    rebalanced at the close of the day before each of them.
+    """
+    periods = pd.DatetimeIndex(dates).to_period(CALENDAR_FREQUENCIES[frequency])
+    return np.flatnonzero(periods[1:] != periods[:-1]) + 1
+
+
+def _holdings(log_growth, weights, start, end):
+    """
+    Value of each holding at the close of days [start, end) for a portfolio
+    worth 1 invested with `weights` at the close of day start - 1.
+    """
+    return weights * np.exp(log_growth[start + 1 : end + 1] - log_growth[start])
+
+
+def _next_breach(log_growth, weights, start, n, band):
+    """
+    End of the segment starting at `start`: the day after the first close at
+    which any weight drifted more than `band` away from its target, or n.
+    """
+    first = start
+    lookahead = BAND_LOOKAHEAD
+    while first < n:
+        last = min(first + lookahead, n)
+        holdings = _holdings(log_growth, weights, start, last)[first - start :]
+        drift = holdings / holdings.sum(axis=1, keepdims=True)
+        breach = np.abs(drift - weights).max(axis=1) > band
+        if breach.any():
+            return first + int(np.argmax(breach)) + 1
+        first = last
+        lookahead *= 2
+    return n
+
+
+def _daily_rebalanced(asset_returns, weights, cost_rate):
+    # Constant weights: every day is its own segment, fully vectorized
+    gross = asset_returns @ weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drift = weights * (1 + asset_returns) / (1 + gross)[:, None]
+    traded = np.nan_to_num(np.abs(drift - weights).sum(axis=1))
+    traded[-1] = 0.0  # No rebalance after the last close
+    returns = (1 + gross) * (1 - cost_rate * traded) - 1
+    return returns, traded, np.arange(len(returns) - 1)
+
+
+# Simulate the portfolio with its holdings drifting between rebalances
+def backtest(
+    asset_returns,
+    weights,
+    dates=None,
+    rebalance="D",
+    band=0.05,
+    cost_bps=0.0,
+    periods_per_year=TRADING_DAYS,
+):
+    """
+    Backtests a portfolio with target `weights` over asset_returns of shape (n, m).
+    rebalance is "D" (daily), "M", "Q" or "A" (calendar, needs `dates`), "band"
+    (when any weight drifts more than `band` from its target) or "none" (buy and hold).
+
+    Holdings drift with the returns between rebalances; each segment between two
+    rebalances is computed at once from one cumulative log-growth matrix. Trading
+    costs of cost_bps per unit traded are deducted at every rebalance.
+
+    Returns the daily net returns, the rebalance positions, the annual one-way
+    turnover and the annual cost drag (both in percent).
+    """
+    asset_returns = np.ascontiguousarray(asset_returns, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    n = len(asset_returns)
+    cost_rate = cost_bps / 10000
+
+    if rebalance == "D":
+        returns, traded, rebalances = _daily_rebalanced(
+            asset_returns, weights, cost_rate
+        )
+    else:
+        # log_growth[t + 1] is the cumulative log growth of each asset up to day t
+        log_growth = np.zeros((n + 1, len(weights)))
+        with np.errstate(divide="ignore"):
+            np.cumsum(np.log1p(asset_returns), axis=0, out=log_growth[1:])
+        if rebalance in CALENDAR_FREQUENCIES:
+            boundaries = list(calendar_rebalance_points(dates, rebalance)) + [n]
+        elif rebalance == "none":
+            boundaries = [n]
+
+        returns = np.empty(n)
+        traded = np.zeros(n)
+        start = 0
+        while start < n:
+            if rebalance == "band":
+                end = _next_breach(log_growth, weights, start, n, band)
+            else:
+                end = boundaries.pop(0)
+            holdings = _holdings(log_growth, weights, start, end)
+            value = np.concatenate([[1.0], holdings.sum(axis=1)])
+            returns[start:end] = value[1:] / value[:-1] - 1
+            if end < n:
+                # Rebalance at the close of day end - 1 back to the target weights
+                drift = holdings[-1] / value[-1]
+                traded[end - 1] = np.abs(drift - weights).sum()
+                returns[end - 1] = (1 + returns[end - 1]) * (
+                    1 - cost_rate * traded[end - 1]
+                ) - 1
+            start = end
+        rebalances = np.flatnonzero(traded)
+
+    years = n / periods_per_year
+    return {
+        "returns": returns,
+        "rebalances": rebalances,
+        "turnover": traded.sum() / 2 / years * 100,
+        "cost_drag": cost_rate * traded.sum() / years * 100,
+    }
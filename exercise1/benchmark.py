@@ -0,0 +1,297 @@
+"""
+Offline benchmarks of the dashboard hot paths.
+
+    python benchmark.py                      # all sizes, recorded or synthetic prices
+    python benchmark.py --sizes small medium --repeat 5
+    python benchmark.py --record AAPL MSFT BTC-USD ^GSPC   # record prices once
+
+The recorded tickers must include the benchmark (^GSPC).
+
+Prices come from benchmark_fixtures/prices.parquet when it was recorded, otherwise
+from a deterministic random walk, and are written to a temporary price store so
+nothing is downloaded while timing. The shared cache also goes to a temporary
+file and is cleared with the in-memory caches before every cold timing. Every run appends one line to
+benchmark_results.jsonl and is compared with the previous one.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_PATH = os.path.join(HERE, "benchmark_fixtures", "prices.parquet")
+RESULTS_PATH = os.path.join(HERE, "benchmark_results.jsonl")
+BENCHMARK_TICKER = "^GSPC"
+# Size name -> (number of assets, number of trading days)
+SIZES = {"small": (3, 1260), "medium": (10, 5040), "large": (30, 10080)}
+
+
+def record_fixture(tickers):
+    """
+    Download the full history of the tickers once and keep it as the fixture.
+    """
+    from query import fetch_historical_prices
+
+    prices = fetch_historical_prices(list(tickers), period="max")
+    os.makedirs(os.path.dirname(FIXTURE_PATH), exist_ok=True)
+    prices.to_parquet(FIXTURE_PATH)
+    print(f"Recorded {prices.shape[1]} tickers x {len(prices)} days to {FIXTURE_PATH}")
+
+
+def fixture_prices(n_assets, days, seed=0):
+    """
+    Wide price frame of n_assets plus the benchmark over the last `days` days:
+    the recorded prices (repeated with a small perturbation when more assets are
+    asked for than were recorded) or random walks when nothing was recorded.
+    """
+    rng = np.random.default_rng(seed)
+    if not os.path.exists(FIXTURE_PATH):
+        dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=days)
+        walks = np.cumsum(rng.normal(0.0003, 0.015, (days, n_assets + 1)), axis=0)
+        columns = [f"SYN{i}" for i in range(n_assets)] + [BENCHMARK_TICKER]
+        return pd.DataFrame(100 * np.exp(walks), index=dates, columns=columns)
+
+    recorded = pd.read_parquet(FIXTURE_PATH).iloc[-days:]
+    benchmark = recorded.pop(BENCHMARK_TICKER)
+    prices = {}
+    for i in range(n_assets):
+        source = recorded.iloc[:, i % recorded.shape[1]]
+        if i < recorded.shape[1]:
+            prices[source.name] = source
+        else:
+            prices[f"{source.name}_{i}"] = source * (
+                1 + rng.normal(0, 0.001, len(source))
+            )
+    prices[BENCHMARK_TICKER] = benchmark
+    return pd.DataFrame(prices)
+
+
+def fill_store(prices):
+    """
+    Write the fixture to the (temporary) price store and metadata index, so the
+    data layer and the app find everything fresh and never call Yahoo.
+    """
+    import data
+
+    metadata = {}
+    for ticker in prices.columns:
+        data._write_stored(ticker, prices[ticker].dropna())
+        metadata[ticker.upper()] = {
+            "name": f"{ticker} (fixture)",
+            "symbol": ticker.upper(),
+            "quote_type": "EQUITY",
+            "fetched_at": time.time(),
+        }
+    with open(os.path.join(data.PRICE_STORE_DIR, "metadata.json"), "w") as file:
+        json.dump(metadata, file)
+
+
+def timed(function, repeat, setup=None):
+    """
+    Best and median wall time of `repeat` calls, in milliseconds.
+    `setup` runs before each call outside the timing (e.g. to clear caches).
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": round(min(times), 3),
+        "median_ms": round(float(np.median(times)), 3),
+    }
+
+
+def clear_caches():
+    import streamlit as st
+
+    from common.shared_cache import default_backend
+
+    st.cache_data.clear()
+    # The shared cache sits below st.cache_data, a cold run must miss there too
+    backend = default_backend()
+    if backend is not None:
+        backend.clear()
+
+
+def benchmark_pipeline(assets, repeat):
+    """
+    Time the processing stages with cold caches (first render) and warm caches
+    (rerun after a widget change).
+    """
+    from data import load_benchmark_data, store_versions
+    from processing import (
+        calculate_backtest,
+        calculate_benchmark_returns,
+        calculate_metrics,
+        calculate_weighted_returns,
+    )
+
+    allocations = [1 / len(assets)] * len(assets)
+
+    def weighted_returns():
+        return calculate_weighted_returns(assets, allocations, "max")
+
+    def metrics():
+        backtest = calculate_backtest(
+            assets, allocations, "max", store_versions(assets)
+        )
+        benchmark_prices = load_benchmark_data(BENCHMARK_TICKER, "max")
+        key = (backtest["key"], BENCHMARK_TICKER)
+        benchmark = calculate_benchmark_returns(
+            benchmark_prices, backtest["returns"], key
+        )
+        return calculate_metrics(
+            backtest["returns"],
+            benchmark,
+            key,
+            turnover=backtest["turnover"],
+            cost_drag=backtest["cost_drag"],
+            periods_per_year=backtest["periods_per_year"],
+        )
+
+    results = {
+        "calculate_weighted_returns.cold": timed(
+            weighted_returns, repeat, clear_caches
+        ),
+        "calculate_weighted_returns.warm": timed(weighted_returns, repeat),
+        "calculate_metrics.cold": timed(metrics, repeat, clear_caches),
+        "calculate_metrics.warm": timed(metrics, repeat),
+    }
+    # A weight change: prices and alignment stay cached, the portfolio is recomputed
+    weights = iter(np.random.default_rng(1).dirichlet(np.ones(len(assets)), 10**6))
+    metrics()
+    results["calculate_weighted_returns.new_weights"] = timed(
+        lambda: calculate_weighted_returns(assets, list(next(weights)), "max"), repeat
+    )
+    return results
+
+
+def benchmark_app(assets, repeat):
+    """
+    Time full script runs of main.py through AppTest: the first run of a session
+    and a rerun without changes.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    from optimizer import to_percentages
+
+    def session():
+        app = AppTest.from_file(os.path.join(HERE, "main.py"), default_timeout=120)
+        app.session_state["assets"] = {"EQUITY": list(assets)}
+        for asset, percentage in zip(
+            assets, to_percentages([1 / len(assets)] * len(assets))
+        ):
+            app.session_state[f"allocation_{asset}"] = float(percentage)
+        app.session_state["generate_chart"] = True
+        return app
+
+    apps = []
+
+    def first_run():
+        apps.append(session().run())
+
+    def rerun():
+        apps[-1].run()
+
+    results = {
+        "app.first_run": timed(first_run, repeat, clear_caches),
+        "app.rerun": timed(rerun, repeat),
+    }
+    errors = [app.exception for app in apps if app.exception]
+    if errors:
+        raise RuntimeError(f"main.py raised during the benchmark: {errors[0]}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results():
+    if not os.path.exists(RESULTS_PATH):
+        return {}
+    with open(RESULTS_PATH) as file:
+        lines = file.read().splitlines()
+    return json.loads(lines[-1])["results"] if lines else {}
+
+
+def report(results, previous):
+    for size, timings in results.items():
+        print(f"\n{size}")
+        for name, timing in timings.items():
+            line = f"  {name:<42} {timing['median_ms']:>10.2f} ms"
+            before = previous.get(size, {}).get(name)
+            if before:
+                line += f"  ({timing['median_ms'] / before['median_ms']:.2f}x previous)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-app", action="store_true", help="skip AppTest runs")
+    parser.add_argument("--record", nargs="+", metavar="TICKER")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture(args.record)
+        return
+
+    # The store locations are read when data.py and shared_cache.py are imported,
+    # so set them first
+    os.environ["PRICE_STORE_DIR"] = tempfile.mkdtemp(prefix="price_store_")
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="shared_cache_"), "cache.sqlite"
+    )
+    os.chdir(HERE)
+    from streamlit.logger import set_log_level
+
+    set_log_level("error")
+
+    results = {}
+    for size in args.sizes:
+        n_assets, days = SIZES[size]
+        prices = fixture_prices(n_assets, days)
+        fill_store(prices)
+        assets = [ticker for ticker in prices.columns if ticker != BENCHMARK_TICKER]
+        results[size] = benchmark_pipeline(assets, args.repeat)
+        if not args.no_app:
+            results[size].update(benchmark_app(assets, args.repeat))
+
+    previous = previous_results()
+    report(results, previous)
+    with open(RESULTS_PATH, "a") as file:
+        entry = {
+            "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "fixture": "recorded" if os.path.exists(FIXTURE_PATH) else "synthetic",
+            "repeat": args.repeat,
+            "results": results,
+        }
+        file.write(json.dumps(entry) + "\n")
+    print(f"\nResults appended to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
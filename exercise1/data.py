@@ -0,0 +1,301 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pandas as pd
+import streamlit as st
+
+from common.instrumentation import instrumented, traced
+from query import MAX_DOWNLOAD_WORKERS, fetch_asset_info, fetch_historical_prices
+
+# Directory of the on-disk price store. Point it at a shared volume so every pod
+# reads and tops up the same files instead of warming its own copy.
+PRICE_STORE_DIR = os.environ.get(
+    "PRICE_STORE_DIR", os.path.join(os.path.dirname(__file__), ".price_store")
+)
+# A stored ticker is only topped up from Yahoo once per interval (seconds)
+TOP_UP_INTERVAL = int(os.environ.get("PRICE_STORE_TOP_UP_INTERVAL", 60 * 60))
+
+# Ticker metadata rarely changes, unknown symbols are retried sooner
+METADATA_TTL = 7 * 24 * 60 * 60
+METADATA_NEGATIVE_TTL = 60 * 60
+METADATA_MAX_ENTRIES = 5000
+
+
+# Translate a yfinance period string into the first date it covers
+def period_start(period, end):
+    """
+    Returns the first date covered by a yfinance period ("1mo", "5y", "ytd", ...)
+    ending at `end`, or None for "max".
+    """
+    if period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=end.year, month=1, day=1)
+    units = {"mo": "months", "wk": "weeks", "d": "days", "y": "years"}
+    for suffix, unit in units.items():
+        if period.endswith(suffix):
+            return end - pd.DateOffset(**{unit: int(period[: -len(suffix)])})
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def _store_path(ticker):
+    # Tickers contain characters like ^ and =, quote them to get a safe file name
+    return os.path.join(PRICE_STORE_DIR, f"{quote(ticker.upper(), safe='')}.parquet")
+
+
+def _read_stored(ticker):
+    path = _store_path(ticker)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)["Close"]
+
+
+def _store_version(ticker):
+    # Modification time of the stored file, None when the ticker was never stored
+    try:
+        return os.stat(_store_path(ticker)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# Stage 1 of the pipeline: the stored history of one ticker, read from disk once
+@instrumented(st.cache_data(show_spinner=False, max_entries=500))
+def read_ticker_history(ticker, version):
+    """
+    `version` (the file modification time) is part of the cache key, so a top-up
+    by this or another process invalidates the entry without hashing any data.
+    """
+    return _read_stored(ticker)
+
+
+def _write_stored(ticker, prices):
+    os.makedirs(PRICE_STORE_DIR, exist_ok=True)
+    path = _store_path(ticker)
+    # Write to a temporary file first so other processes never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    prices.rename("Close").to_frame().to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _is_fresh(ticker):
+    path = _store_path(ticker)
+    return time.time() - os.path.getmtime(path) < TOP_UP_INTERVAL
+
+
+# Bring the store up to date for the given tickers
+def _top_up(tickers, stored):
+    """
+    Downloads only what is missing: full history for tickers never seen before and
+    the bars after the last stored date for the others, one batched request each.
+    """
+    cold = [ticker for ticker in tickers if stored[ticker] is None]
+    stale = [
+        ticker
+        for ticker in tickers
+        if stored[ticker] is not None and not _is_fresh(ticker)
+    ]
+
+    if cold:
+        downloaded = fetch_historical_prices(cold, period="max")
+        for ticker in cold:
+            prices = downloaded[ticker].dropna()
+            if not prices.empty:
+                _write_stored(ticker, prices)
+                stored[ticker] = prices
+
+    if stale:
+        # The last stored bar is fetched again, it may have been written mid-session
+        start = min(stored[ticker].index[-1] for ticker in stale)
+        downloaded = fetch_historical_prices(stale, start=start.strftime("%Y-%m-%d"))
+        for ticker in stale:
+            new_prices = downloaded[ticker].dropna()
+            prices = pd.concat([stored[ticker], new_prices])
+            prices = prices[~prices.index.duplicated(keep="last")].sort_index()
+            # Rewrite even without new bars so the file mtime records the check
+            _write_stored(ticker, prices)
+            stored[ticker] = prices
+
+    return stored
+
+
+# Load close prices from the local store, topping it up from Yahoo when needed
+@traced
+def load_prices(tickers, period):
+    """
+    Returns a wide DataFrame (dates x tickers) of close prices for the period.
+    Any period is served by slicing the locally stored full history.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    stored = _top_up(
+        tickers,
+        {
+            ticker: read_ticker_history(ticker, _store_version(ticker))
+            for ticker in tickers
+        },
+    )
+
+    prices = pd.DataFrame(
+        {
+            ticker: series if series is not None else pd.Series(dtype=float)
+            for ticker, series in stored.items()
+        },
+        columns=tickers,
+    )
+    if prices.empty:
+        return prices
+    start = period_start(period, end=pd.Timestamp.today().normalize())
+    if start is not None:
+        prices = prices.loc[prices.index >= start]
+    return prices
+
+
+# Version of each ticker's stored history, after topping up the stale ones
+@traced
+def store_versions(tickers):
+    """
+    Returns the modification times of the stored files of the tickers, topping up
+    those not checked within TOP_UP_INTERVAL first. Cached stages computed from the
+    prices take it as an argument, so a top-up reaches them on the next run.
+    Costs one stat per ticker when everything is fresh.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    stale = [
+        ticker
+        for ticker in tickers
+        if _store_version(ticker) is None or not _is_fresh(ticker)
+    ]
+    if stale:
+        load_prices(stale, "max")
+    return tuple(_store_version(ticker) for ticker in tickers)
+
+
+# Load a single benchmark series from the local store
+def load_benchmark_data(benchmark_ticker, period):
+    """
+    Returns the close prices of the benchmark for the selected period.
+    """
+    return load_prices([benchmark_ticker], period)[benchmark_ticker].dropna()
+
+
+class AssetMetadataIndex:
+    """
+    Persistent cache of (long name, symbol, quote type) per ticker.
+    Entries expire after a TTL, the least recently used ones are evicted past
+    max_entries, and unknown symbols are remembered as negative entries.
+    """
+
+    def __init__(
+        self,
+        path,
+        ttl=METADATA_TTL,
+        negative_ttl=METADATA_NEGATIVE_TTL,
+        max_entries=METADATA_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            entries = json.load(file)
+        # Stored in least to most recently used order
+        for ticker, entry in entries.items():
+            self._entries[ticker] = entry
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._entries, file)
+        os.replace(tmp_path, self.path)
+
+    def _lookup(self, ticker):
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        ttl = self.ttl if entry["name"] else self.negative_ttl
+        if time.time() - entry["fetched_at"] > ttl:
+            del self._entries[ticker]
+            return None
+        self._entries.move_to_end(ticker)
+        return entry
+
+    def _store(self, ticker, data):
+        name, symbol, quote_type = data
+        self._entries[ticker] = {
+            "name": name if name and quote_type else None,
+            "symbol": symbol,
+            "quote_type": quote_type,
+            "fetched_at": time.time(),
+        }
+        self._entries.move_to_end(ticker)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @traced
+    def warm_up(self, tickers):
+        """
+        Fetches metadata for every ticker not in the index, concurrently, and
+        persists the index once. Returns {ticker: error} for failed fetches.
+        """
+        tickers = [ticker.upper() for ticker in dict.fromkeys(tickers)]
+        with self._lock:
+            missing = [ticker for ticker in tickers if self._lookup(ticker) is None]
+        if not missing:
+            return {}
+
+        def fetch(ticker):
+            try:
+                return ticker, fetch_asset_info(ticker), None
+            except Exception as e:
+                return ticker, None, e
+
+        errors = {}
+        with ThreadPoolExecutor(
+            max_workers=min(len(missing), MAX_DOWNLOAD_WORKERS)
+        ) as executor:
+            results = list(executor.map(fetch, missing))
+        with self._lock:
+            for ticker, data, error in results:
+                # Network errors are not cached, only symbols Yahoo doesn't know
+                if error is not None:
+                    errors[ticker] = error
+                else:
+                    self._store(ticker, data)
+            self._save()
+        return errors
+
+    def get(self, ticker):
+        """
+        Returns (long name, symbol, quote type) of the ticker, or Nones if it is unknown.
+        """
+        ticker = ticker.upper()
+        with self._lock:
+            entry = self._lookup(ticker)
+        if entry is None:
+            errors = self.warm_up([ticker])
+            if ticker in errors:
+                st.error(f"Error fetching data for {ticker}: {errors[ticker]}")
+                return None, None, None
+            with self._lock:
+                entry = self._lookup(ticker)
+        if entry is None or entry["name"] is None:
+            return None, None, None
+        return entry["name"], entry["symbol"], entry["quote_type"]
+
+
+# One metadata index per server process, shared by all sessions
+@instrumented(st.cache_resource)
+def asset_metadata_index():
+    return AssetMetadataIndex(os.path.join(PRICE_STORE_DIR, "metadata.json"))
@@ -3,6 +3,16 @@ import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
+from common.chart_data import chart_times, chart_values
+from common.downsample import downsample
+from common.instrumentation import span, traced
+
+
+# Sending the figure to the browser (serialization) is timed apart from building it
+def render_chart(fig):
+    with span("fig.render"):
+        return st.plotly_chart(fig, use_container_width=True)
+
 
 def placeholder_chart():
     dates = pd.date_range(start="2023-01-01", periods=12, freq="M")
@@ -51,19 +61,38 @@ def placeholder_chart():
         gridcolor="lightgrey",
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    render_chart(fig)
+
+
+# Reduce a series to the points worth plotting in the visible range
+def downsample_series(series, x_range=None, max_points=None):
+    series = series.dropna()
+    indices = downsample(
+        series.index.to_numpy(), series.to_numpy(), x_range, max_points=max_points
+    )
+    return series.iloc[indices]
 
 
-def plot_cumulative_returns(portfolio_returns, benchmark_returns, benchmark_name):
+@traced
+def plot_cumulative_returns(
+    portfolio_returns, benchmark_returns, benchmark_name, x_range=None, max_points=None
+):
     """
     Generates a Plotly chart showing cumulative returns of the portfolio
-    compared to the benchmark (S&P 500).
+    compared to the benchmark (S&P 500). Only the visible x_range is sent,
+    downsampled with LTTB to a few points per pixel.
     """
+    portfolio = downsample_series(
+        (1 + portfolio_returns.fillna(0)).cumprod() * 100, x_range, max_points
+    )
+    benchmark = downsample_series(
+        (1 + benchmark_returns.fillna(0)).cumprod() * 100, x_range, max_points
+    )
     fig = go.Figure()
     fig.add_trace(
         go.Scatter(
-            x=portfolio_returns.index,
-            y=(1 + portfolio_returns).cumprod() * 100,
+            x=chart_times(portfolio.index),
+            y=chart_values(portfolio),
             mode="lines",
             name="Portfolio",
             line=dict(color="black"),
@@ -71,8 +100,8 @@ def plot_cumulative_returns(portfolio_returns, benchmark_returns, benchmark_name
     )
     fig.add_trace(
         go.Scatter(
-            x=benchmark_returns.index,
-            y=(1 + benchmark_returns).cumprod() * 100,
+            x=chart_times(benchmark.index),
+            y=chart_values(benchmark),
             mode="lines",
             name=benchmark_name,
             line=dict(color="#ff6a1f"),
@@ -81,17 +110,25 @@ def plot_cumulative_returns(portfolio_returns, benchmark_returns, benchmark_name
     fig.update_layout(
         title="",
         xaxis_title="Date",
+        xaxis_type="date",
         yaxis_title="Cumulative Return (%)",
         legend=dict(yanchor="top", y=0.99, xanchor="right", x=0.99),
     )
-    return st.plotly_chart(fig, use_container_width=True)
+    return render_chart(fig)
+
+
+# Format a metric value, "-" when it is not available (e.g. history shorter than the window)
+def format_metric(value, fmt, suffix="%"):
+    return "-" if value is None or np.isnan(value) else f"{value:{fmt}}{suffix}"
 
 
 # @st.cache_data(show_spinner=True)
-def display_metrics_table(metrics):
+@traced
+def display_metrics_table(metrics, simulation=None):
     """
     Display the calculated metrics in a Streamlit table, formatted
-    to resemble the provided image.
+    to resemble the provided image. The simulated VaR and CVaR rows are
+    shown when a Monte Carlo simulation is given.
     """
     # Create a list of tuples (metric_name, metric_value)
     metric_list = [
@@ -108,20 +145,213 @@ def display_metrics_table(metrics):
             f"{metrics['Tracking Error']:.1f}%",
         ),  # Using Tracking Error here
         ("maxDrawdown", f"{metrics['Max Drawdown']:.1f}%"),
-        ("VaR95 (monthly)", "-"),  # Placeholder for monthly VaR
-        ("VaR95 (annually)", "-"),  # Placeholder for annual VaR
+        ("VaR95 (monthly)", format_metric(metrics["VaR 95% (monthly)"], ".1f")),
+        ("VaR95 (annually)", format_metric(metrics["VaR 95% (annually)"], ".1f")),
         # ("HitRatio", f"{metrics['Hit Ratio']:.0f}%"),
-        ("1Y_RollingHitRatior", "-"),  # Placeholder
-        ("3Y_RollingHitRatior", "-"),  # Placeholder
+        (
+            "1Y_RollingHitRatior",
+            format_metric(metrics["1Y Rolling Hit Ratio"], ".0f"),
+        ),
+        (
+            "3Y_RollingHitRatior",
+            format_metric(metrics["3Y Rolling Hit Ratio"], ".0f"),
+        ),
         ("maxRelativeDrawd", f"{metrics['Relative Drawdown']:.1f}%"),
-        ("1Y", "-"),  # Placeholder
-        ("3Y", "-"),  # Placeholder
-        ("5Y", "-"),  # Placeholder
+        ("1Y", format_metric(metrics["1Y Return"], ".1f")),
+        ("3Y", format_metric(metrics["3Y Return"], ".1f")),
+        ("5Y", format_metric(metrics["5Y Return"], ".1f")),
         ("alpha (vs SP500)", f"{metrics['Alpha']:.1f}%"),
         ("beta (vs SP500)", f"{metrics['Beta']:.1f}%"),
-        ("turnover (ann)", f"{metrics['Turnover Rate']:.1f}%"),
+        ("turnover (ann)", format_metric(metrics["Turnover Rate"], ".1f")),
+        ("costDrag (ann)", format_metric(metrics["Cost Drag"], ".2f")),
     ]
+    if simulation is not None:
+        years = f"{simulation['years']:g}Y"
+        metric_list += [
+            (f"simVaR95 ({years})", format_metric(simulation["VaR"], ".1f")),
+            (f"simCVaR95 ({years})", format_metric(simulation["CVaR"], ".1f")),
+        ]
 
     # Create a DataFrame for better display
     metrics_df = pd.DataFrame(metric_list, columns=["KPI", "Benchmark"])
-    st.dataframe(data=metrics_df, hide_index=True, use_container_width=True, height=775)
+    # Tall enough to show every row (35px per row plus the header) without scrolling
+    st.dataframe(
+        data=metrics_df,
+        hide_index=True,
+        use_container_width=True,
+        height=35 * (len(metrics_df) + 1) + 3,
+    )
+
+
+@traced
+def plot_rolling_analytics(rolling, benchmark_name, x_range=None, max_points=None):
+    """
+    Generates a Plotly chart of the trailing 1Y return of the portfolio and the
+    benchmark, with the 1Y rolling hit ratio on a secondary axis.
+    """
+    rolling = rolling.dropna(subset=["1Y Return"])
+    indices = downsample(
+        rolling.index.to_numpy(),
+        rolling["1Y Return"].to_numpy(),
+        x_range,
+        max_points=max_points,
+    )
+    rolling = rolling.iloc[indices]
+    dates = chart_times(rolling.index)
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=dates,
+            y=chart_values(rolling["1Y Return"]),
+            mode="lines",
+            name="Portfolio 1Y Return",
+            line=dict(color="black"),
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dates,
+            y=chart_values(rolling["1Y Benchmark Return"]),
+            mode="lines",
+            name=f"{benchmark_name} 1Y Return",
+            line=dict(color="#ff6a1f"),
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dates,
+            y=chart_values(rolling["1Y Rolling Hit Ratio"]),
+            mode="lines",
+            name="1Y Rolling Hit Ratio",
+            line=dict(color="grey", dash="dot"),
+            yaxis="y2",
+        )
+    )
+    fig.update_layout(
+        title="",
+        xaxis_title="Date",
+        xaxis_type="date",
+        yaxis=dict(title="Rolling 1Y Return (%)", ticksuffix="%"),
+        yaxis2=dict(
+            title="Hit Ratio (%)",
+            overlaying="y",
+            side="right",
+            range=[0, 100],
+            showgrid=False,
+        ),
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01),
+    )
+    return render_chart(fig)
+
+
+@traced
+def plot_efficient_frontier(optimization, current_weights=None):
+    """
+    Generates a Plotly chart of the efficient frontier with a cloud of random
+    portfolios, the minimum variance and maximum Sharpe portfolios and the
+    current allocation, in annualized volatility / expected return space.
+    """
+    expected_returns = optimization["expected_returns"]
+    covariance = optimization["covariance"]
+
+    def risk_return(weights):
+        return (
+            np.sqrt(weights @ covariance @ weights) * 100,
+            weights @ expected_returns * 100,
+        )
+
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scattergl(
+            x=chart_values(optimization["cloud_volatility"] * 100),
+            y=chart_values(optimization["cloud_return"] * 100),
+            mode="markers",
+            name="Random Portfolios",
+            marker=dict(color="lightgrey", size=3),
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=chart_values(optimization["frontier_volatility"] * 100),
+            y=chart_values(optimization["frontier_return"] * 100),
+            mode="lines",
+            name="Efficient Frontier",
+            line=dict(color="black"),
+        )
+    )
+    points = [
+        ("Min Variance", optimization["min_variance"], "#1f77b4"),
+        ("Max Sharpe", optimization["max_sharpe"], "#ff6a1f"),
+    ]
+    if current_weights is not None:
+        points.append(("Current", np.asarray(current_weights), "green"))
+    for name, weights, color in points:
+        volatility, expected_return = risk_return(weights)
+        fig.add_trace(
+            go.Scatter(
+                x=[volatility],
+                y=[expected_return],
+                mode="markers",
+                name=name,
+                marker=dict(color=color, size=12, symbol="diamond"),
+            )
+        )
+    fig.update_layout(
+        title="",
+        xaxis_title="Annual Volatility (%)",
+        yaxis_title="Expected Annual Return (%)",
+        legend=dict(yanchor="bottom", y=0.01, xanchor="right", x=0.99),
+    )
+    return render_chart(fig)
+
+
+@traced
+def plot_simulation_fan(simulation):
+    """
+    Generates a Plotly fan chart of the simulated portfolio value (start = 100):
+    the median path with the 25-75 and 5-95 percentile bands.
+    """
+    steps = simulation["steps"]
+    percentiles = {
+        percentile: chart_values(values * 100)
+        for percentile, values in simulation["percentiles"].items()
+    }
+    fig = go.Figure()
+    for low, high, color in [(5, 95, "#ffd9c4"), (25, 75, "#ffa774")]:
+        fig.add_trace(
+            go.Scatter(
+                x=steps,
+                y=percentiles[high],
+                mode="lines",
+                line=dict(width=0),
+                showlegend=False,
+                hoverinfo="skip",
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=steps,
+                y=percentiles[low],
+                mode="lines",
+                line=dict(width=0),
+                fill="tonexty",
+                fillcolor=color,
+                name=f"{low}-{high}th percentile",
+            )
+        )
+    fig.add_trace(
+        go.Scatter(
+            x=steps,
+            y=percentiles[50],
+            mode="lines",
+            name="Median",
+            line=dict(color="black"),
+        )
+    )
+    fig.update_layout(
+        title="",
+        xaxis_title="Days Ahead",
+        yaxis_title="Portfolio Value (start = 100)",
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01),
+    )
+    return render_chart(fig)
@@ -1,12 +1,27 @@
 import streamlit as st
 
+from data import asset_metadata_index, load_benchmark_data, store_versions
 from fig import (
     placeholder_chart,
     plot_cumulative_returns,
+    plot_efficient_frontier,
+    plot_rolling_analytics,
+    plot_simulation_fan,
     display_metrics_table,
 )
-from processing import calculate_metrics, calculate_weighted_returns
-from query import fetch_asset_data, fetch_benchmark_data
+from alignment import FILL_POLICIES
+from backtest import REBALANCING
+from common import instrumentation
+from optimizer import to_percentages
+from processing import (
+    calculate_backtest,
+    calculate_benchmark_returns,
+    calculate_metrics,
+    calculate_optimization,
+    calculate_rolling_analytics,
+    calculate_simulation,
+    series_fingerprint,
+)
 
 logo_path = "../public/Logo_Final_Orange.png"
 
@@ -24,6 +39,15 @@ st.set_page_config(
 )
 
 
+# Button callback: runs before the next rerun, so the allocation widgets can be updated
+def apply_allocation(assets, weights):
+    """
+    Replace the allocation inputs with the given weights as whole percentages.
+    """
+    for asset, percentage in zip(assets, to_percentages(weights)):
+        st.session_state[f"allocation_{asset}"] = float(percentage)
+
+
 # The main function that runs the dashboard.
 def dashboard():
     """
@@ -40,6 +64,14 @@ def dashboard():
     if "grand_total_allocation" not in st.session_state:
         st.session_state.grand_total_allocation = 0.0
 
+    # Metadata of every portfolio asset is fetched in one concurrent warm-up, widget
+    # interactions afterwards are served from the index without network calls
+    metadata_index = asset_metadata_index()
+    if "assets" in st.session_state:
+        metadata_index.warm_up(
+            asset for assets in st.session_state.assets.values() for asset in assets
+        )
+
     # Render header with the logo and title
     header_col1, header_col2 = st.columns([1, 10], vertical_alignment="center")
     with header_col1:
@@ -88,7 +120,7 @@ def dashboard():
                                 f"{new_asset.upper()} is already in the portfolio!"
                             )
                         else:
-                            name, symbol, quote_type = fetch_asset_data(new_asset)
+                            name, symbol, quote_type = metadata_index.get(new_asset)
                             if not name or not quote_type:
                                 st.error(f"Asset {new_asset} could not be found.")
                             else:
@@ -133,7 +165,7 @@ def dashboard():
 
                             # Display assets within the category
                             for asset in st.session_state.assets[category]:
-                                name, symbol, quote_type = fetch_asset_data(asset)
+                                name, symbol, quote_type = metadata_index.get(asset)
 
                                 # Display asset information in json format
                                 # st.write(yf.Ticker(asset).info)
@@ -277,28 +309,176 @@ def dashboard():
                         index=6,
                         horizontal=True,
                     )
+                rebal_col1, rebal_col2, rebal_col3, rebal_col4 = st.columns(4)
+                with rebal_col1:
+                    # Mixed calendars (e.g. crypto trades on weekends, stocks do not)
+                    policy = st.selectbox(
+                        label="Trading days",
+                        options=FILL_POLICIES,
+                        format_func=lambda x: {
+                            "ffill": "All (carry prices forward)",
+                            "intersection": "Common to all assets",
+                        }.get(x, x),
+                    )
+                with rebal_col2:
+                    rebalancing = st.selectbox(
+                        label="Rebalancing", options=list(REBALANCING), index=0
+                    )
+                with rebal_col3:
+                    band = st.number_input(
+                        label="Threshold band (%)",
+                        min_value=0.5,
+                        max_value=50.0,
+                        value=5.0,
+                        disabled=rebalancing != "Threshold band",
+                    )
+                with rebal_col4:
+                    cost_bps = st.number_input(
+                        label="Transaction cost (bps)",
+                        min_value=0.0,
+                        max_value=500.0,
+                        value=0.0,
+                    )
             chart = st.empty()
             chart2 = st.empty()
             chart3 = st.empty()
+            chart4 = st.empty()
+            simulation = None
             if not st.session_state.generate_chart:
                 chart = placeholder_chart()
             else:
                 # Get the submitted portfolio and calculate performance
-                benchmark_data = fetch_benchmark_data(
+                benchmark_data = load_benchmark_data(
                     benchmark_index,
                     period,
                 )
-                portfolio_returns = calculate_weighted_returns(
-                    selected_assets, allocations, period
+                # Tops up stale tickers, a new version recomputes the cached stages
+                versions = store_versions(selected_assets)
+                backtest = calculate_backtest(
+                    selected_assets,
+                    allocations,
+                    period,
+                    versions,
+                    REBALANCING[rebalancing],
+                    band / 100,
+                    cost_bps,
+                    policy,
+                )
+                portfolio_returns = backtest["returns"]
+                periods_per_year = backtest["periods_per_year"]
+                # Cache key of everything computed from the portfolio and benchmark
+                analysis_key = (
+                    backtest["key"],
+                    benchmark_index,
+                    series_fingerprint(benchmark_data),
                 )
-
-                # Generate and display the cumulative returns plot
-                chart = plot_cumulative_returns(
-                    portfolio_returns=portfolio_returns,
-                    benchmark_returns=benchmark_data.pct_change(),
-                    benchmark_name=benchmark_index,
+                # The benchmark is put on the calendar of the portfolio once
+                benchmark_returns = calculate_benchmark_returns(
+                    benchmark_data, portfolio_returns, analysis_key
                 )
 
+                with chart.container():
+                    chart_slot = st.empty()
+                    # Zooming sends the visible range only, re-sampled at finer resolution
+                    visible_range = None
+                    if len(portfolio_returns) > 1:
+                        first_date = portfolio_returns.index[0].to_pydatetime()
+                        last_date = portfolio_returns.index[-1].to_pydatetime()
+                        zoom = st.slider(
+                            label="Visible range",
+                            min_value=first_date,
+                            max_value=last_date,
+                            value=(first_date, last_date),
+                            format="MMM YYYY",
+                        )
+                        if zoom != (first_date, last_date):
+                            visible_range = zoom
+
+                    # Generate and display the cumulative returns plot
+                    with chart_slot:
+                        plot_cumulative_returns(
+                            portfolio_returns=portfolio_returns,
+                            benchmark_returns=benchmark_returns,
+                            benchmark_name=benchmark_index,
+                            x_range=visible_range,
+                        )
+
+                # Rolling 1Y returns and hit ratio against the benchmark
+                with chart2.container():
+                    st.write("#### Rolling Analytics")
+                    plot_rolling_analytics(
+                        calculate_rolling_analytics(
+                            portfolio_returns,
+                            benchmark_returns,
+                            analysis_key,
+                            periods_per_year,
+                        ),
+                        benchmark_name=benchmark_index,
+                        x_range=visible_range,
+                    )
+
+                # Optimization mode: min-variance / max-Sharpe weights and the frontier
+                with chart3.container():
+                    with st.expander("Optimize Allocation"):
+                        if len(selected_assets) < 2:
+                            st.info(
+                                "Add at least two assets to optimize the portfolio."
+                            )
+                        # Same aligned returns as the backtest, one row has no covariance
+                        elif len(portfolio_returns) < 2:
+                            st.info("Not enough history to optimize the portfolio.")
+                        else:
+                            optimization = calculate_optimization(
+                                selected_assets, period, versions, policy=policy
+                            )
+                            plot_efficient_frontier(optimization, allocations)
+                            opt_col1, opt_col2 = st.columns(2)
+                            for column, label, key in [
+                                (opt_col1, "Apply Min Variance", "min_variance"),
+                                (opt_col2, "Apply Max Sharpe", "max_sharpe"),
+                            ]:
+                                with column:
+                                    st.button(
+                                        label=label,
+                                        type="secondary",
+                                        use_container_width=True,
+                                        on_click=apply_allocation,
+                                        args=(selected_assets, optimization[key]),
+                                    )
+
+                # Monte Carlo fan of the portfolio value, its tail risk goes to the results
+                with chart4.container():
+                    with st.expander("Monte Carlo Simulation"):
+                        sim_col1, sim_col2, sim_col3 = st.columns(3)
+                        with sim_col1:
+                            horizon_years = st.selectbox(
+                                label="Horizon (years)", options=[1, 3, 5], index=0
+                            )
+                        with sim_col2:
+                            n_paths = st.selectbox(
+                                label="Number of paths",
+                                options=[10000, 50000, 100000],
+                                index=0,
+                            )
+                        with sim_col3:
+                            method = st.radio(
+                                label="Method",
+                                options=["bootstrap", "parametric"],
+                                horizontal=True,
+                            )
+                        if len(portfolio_returns.dropna()) < 2:
+                            st.info("Not enough history to simulate the portfolio.")
+                        else:
+                            simulation = calculate_simulation(
+                                portfolio_returns,
+                                backtest["key"],
+                                horizon_years * periods_per_year,
+                                n_paths,
+                                method,
+                                periods_per_year=periods_per_year,
+                            )
+                            plot_simulation_fan(simulation)
+
     with main_col3:
         with st.container(border=True, key="metrics_table"):
             st.write("#### Results")
@@ -308,15 +488,21 @@ def dashboard():
             if not st.session_state.generate_chart:
                 st.info("Add and save assets to view performance metrics.")
             else:
-                portfolio_returns = calculate_weighted_returns(
-                    selected_assets, allocations, period
-                )
+                # Reuses the backtest and benchmark of the performance column
                 metrics = calculate_metrics(
-                    portfolio_returns, benchmark_data.pct_change()
+                    portfolio_returns,
+                    benchmark_returns,
+                    analysis_key,
+                    turnover=backtest["turnover"],
+                    cost_drag=backtest["cost_drag"],
+                    periods_per_year=backtest["periods_per_year"],
                 )
-                display_metrics_table(metrics)
+                display_metrics_table(metrics, simulation)
 
 
 # Run the app
 if __name__ == "__main__":
-    dashboard()
+    # Every rerun is traced when instrumentation is on, ?debug=1 shows the panel
+    with instrumentation.run("rerun"):
+        dashboard()
+    instrumentation.debug_panel()
@@ -0,0 +1,101 @@
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+# Compute every KPI from shared intermediates
+def compute_metrics(
+    portfolio_returns,
+    benchmark_returns,
+    risk_free_rate=0.0,
+    periods_per_year=TRADING_DAYS,
+):
+    """
+    Calculates performance and risk metrics for one or many portfolios at once.
+    portfolio_returns is an array of shape (n,) or (k, n) with k portfolios over n
+    periods, benchmark_returns has shape (n,) and must already be aligned with it.
+    Returns a dict of arrays of shape (k,) (or floats for a single portfolio).
+    """
+    returns = np.ascontiguousarray(portfolio_returns, dtype=float)
+    single = returns.ndim == 1
+    returns = np.atleast_2d(returns)
+    benchmark = np.ascontiguousarray(benchmark_returns, dtype=float)
+    n = returns.shape[1]
+    annualizer = np.sqrt(periods_per_year)
+
+    # Shared intermediates
+    wealth = np.cumprod(1 + returns, axis=1)
+    benchmark_wealth = np.cumprod(1 + benchmark)
+    mean = returns.mean(axis=1)
+    deviations = returns - mean[:, None]
+    std = np.sqrt((deviations**2).sum(axis=1) / (n - 1))
+    benchmark_mean = benchmark.mean()
+    benchmark_deviations = benchmark - benchmark_mean
+    active = returns - benchmark
+    active_mean = mean - benchmark_mean
+    active_std = np.sqrt(((active - active_mean[:, None]) ** 2).sum(axis=1) / (n - 1))
+
+    # Performance Metrics
+    cumulative_returns = wealth[:, -1] - 1
+    annual_returns = wealth[:, -1] ** (periods_per_year / n) - 1
+    excess_return = annual_returns - risk_free_rate
+
+    # Risk Metrics
+    annual_volatility = std * annualizer
+    max_drawdown = (wealth / np.maximum.accumulate(wealth, axis=1) - 1).min(axis=1)
+    relative_drawdown = (wealth / benchmark_wealth - 1).min(axis=1)
+    var_95 = np.quantile(returns, 0.05, axis=1)
+    tracking_error = active_std * annualizer
+    information_ratio = active_mean / active_std * annualizer
+
+    # Sortino Ratio, downside deviation is the std of the negative returns only
+    downside = returns < 0
+    downside_count = downside.sum(axis=1)
+    downside_sum = np.where(downside, returns, 0.0).sum(axis=1)
+    downside_squares = np.where(downside, returns**2, 0.0).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        downside_std = np.sqrt(
+            (downside_squares - downside_sum**2 / downside_count) / (downside_count - 1)
+        )
+        sortino_ratio = excess_return / (downside_std * annualizer)
+        sharpe_ratio = excess_return / annual_volatility
+
+    # Alpha and Beta
+    beta = deviations @ benchmark_deviations / (benchmark_deviations**2).sum()
+    alpha = excess_return - beta * (benchmark_mean * periods_per_year)
+
+    metrics = {
+        "Cumulative Returns": cumulative_returns * 100,
+        "Annual Returns": annual_returns * 100,
+        "Annual Volatility": annual_volatility * 100,
+        "Max Drawdown": max_drawdown * 100,
+        "Sharpe Ratio": sharpe_ratio,
+        "Sortino Ratio": sortino_ratio,
+        "Beta": beta,
+        "Alpha": alpha * 100,
+        "VaR 95%": var_95 * 100,
+        "Tracking Error": tracking_error * 100,
+        "Information Ratio": information_ratio,
+        "Relative Drawdown": relative_drawdown * 100,
+    }
+    if single:
+        return {name: float(values[0]) for name, values in metrics.items()}
+    return metrics
+
+
+# Score many allocations of the same assets in one batch
+def score_allocations(
+    asset_returns,
+    weights,
+    benchmark_returns,
+    risk_free_rate=0.0,
+    periods_per_year=TRADING_DAYS,
+):
+    """
+    asset_returns has shape (n, m) for m assets, weights has shape (k, m).
+    Returns the metrics of all k portfolios as arrays of shape (k,).
+    """
+    portfolio_returns = np.atleast_2d(weights) @ np.asarray(asset_returns).T
+    return compute_metrics(
+        portfolio_returns, benchmark_returns, risk_free_rate, periods_per_year
+    )
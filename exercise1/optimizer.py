@@ -0,0 +1,125 @@
+import numpy as np
+
+from metrics import TRADING_DAYS
+
+
+# Annualized expected returns and covariance matrix, computed once per returns matrix
+def estimate_moments(asset_returns, periods_per_year=TRADING_DAYS):
+    """
+    asset_returns has shape (n, m) for n periods and m assets, without NaN.
+    Returns (expected returns of shape (m,), covariance of shape (m, m)).
+    """
+    asset_returns = np.ascontiguousarray(asset_returns, dtype=float)
+    mean = asset_returns.mean(axis=0)
+    deviations = asset_returns - mean
+    covariance = deviations.T @ deviations / (len(asset_returns) - 1)
+    return mean * periods_per_year, covariance * periods_per_year
+
+
+def project_to_simplex(weights):
+    """
+    Euclidean projection of each row onto {w >= 0, sum(w) = 1}, vectorized
+    over rows (Duchi et al., 2008).
+    """
+    weights = np.atleast_2d(weights)
+    m = weights.shape[1]
+    ordered = -np.sort(-weights, axis=1)
+    cumulative = np.cumsum(ordered, axis=1) - 1
+    steps = np.arange(1, m + 1)
+    # Number of positive entries of the projection, per row
+    support = (ordered - cumulative / steps > 0).sum(axis=1)
+    theta = cumulative[np.arange(len(weights)), support - 1] / support
+    return np.maximum(weights - theta[:, None], 0.0)
+
+
+# Long-only mean-variance optimal portfolios for many risk tolerances at once
+def efficient_weights(expected_returns, covariance, risk_tolerances, iterations=500):
+    """
+    Minimizes w'Cw - t * mu'w over long-only, fully invested weights for every
+    risk tolerance t with accelerated projected gradient descent. All tolerances
+    are solved together as one (k, m) batch. t = 0 is the minimum variance portfolio.
+    """
+    risk_tolerances = np.asarray(risk_tolerances, dtype=float)[:, None]
+    m = len(expected_returns)
+    # 1 / Lipschitz constant of the gradient 2Cw
+    step = 1 / (2 * np.linalg.eigvalsh(covariance)[-1])
+    weights = np.full((len(risk_tolerances), m), 1 / m)
+    momentum = weights
+    for iteration in range(1, iterations + 1):
+        gradient = 2 * momentum @ covariance - risk_tolerances * expected_returns
+        new_weights = project_to_simplex(momentum - step * gradient)
+        momentum = new_weights + (iteration - 1) / (iteration + 2) * (
+            new_weights - weights
+        )
+        weights = new_weights
+    return weights
+
+
+def portfolio_risk_return(weights, expected_returns, covariance):
+    """
+    Annualized volatility and expected return of a (k, m) batch of weights.
+    """
+    weights = np.atleast_2d(weights)
+    volatility = np.sqrt(np.einsum("ij,jk,ik->i", weights, covariance, weights))
+    return volatility, weights @ expected_returns
+
+
+# Run the whole optimization from one aligned returns matrix
+def optimize_portfolio(
+    asset_returns,
+    risk_free_rate=0.0,
+    periods_per_year=TRADING_DAYS,
+    frontier_points=100,
+    random_portfolios=5000,
+    seed=0,
+):
+    """
+    Returns the long-only minimum variance and maximum Sharpe weights, the
+    efficient frontier and a cloud of random portfolios, all evaluated in
+    vectorized batches from a covariance matrix computed once.
+    """
+    expected_returns, covariance = estimate_moments(asset_returns, periods_per_year)
+    m = len(expected_returns)
+
+    # Risk tolerances from 0 (min variance) up to where the frontier reaches the
+    # highest-return asset, spaced geometrically to cover the low-risk end densely
+    spread = np.ptp(expected_returns) or 1.0
+    largest = 4 * np.linalg.eigvalsh(covariance)[-1] / spread
+    tolerances = np.concatenate(
+        [[0.0], np.geomspace(largest * 1e-4, largest, frontier_points - 1)]
+    )
+    frontier = efficient_weights(expected_returns, covariance, tolerances)
+    frontier_volatility, frontier_return = portfolio_risk_return(
+        frontier, expected_returns, covariance
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frontier_sharpe = (frontier_return - risk_free_rate) / frontier_volatility
+
+    rng = np.random.default_rng(seed)
+    cloud = rng.dirichlet(np.ones(m), size=random_portfolios)
+    cloud_volatility, cloud_return = portfolio_risk_return(
+        cloud, expected_returns, covariance
+    )
+
+    return {
+        "min_variance": frontier[0],
+        "max_sharpe": frontier[np.nanargmax(frontier_sharpe)],
+        "frontier_volatility": frontier_volatility,
+        "frontier_return": frontier_return,
+        "cloud_volatility": cloud_volatility,
+        "cloud_return": cloud_return,
+        "expected_returns": expected_returns,
+        "covariance": covariance,
+    }
+
+
+def to_percentages(weights):
+    """
+    Whole-number percentages summing to exactly 100 (largest remainder method),
+    so the suggested allocation passes the 100% check of the portfolio form.
+    """
+    scaled = np.asarray(weights, dtype=float) * 100
+    percentages = np.floor(scaled).astype(int)
+    remainder = 100 - percentages.sum()
+    percentages[np.argsort(percentages - scaled)[:remainder]] += 1
+    return percentages
@@ -1,98 +1,133 @@
+import hashlib
+
 import numpy as np
 import pandas as pd
 import streamlit as st
 
-from query import fetch_historical_data
+from alignment import load_aligned_returns, returns_on_calendar
+from backtest import backtest
+from common.instrumentation import instrumented
+from common.shared_cache import shared_cache
+from data import TOP_UP_INTERVAL, store_versions
+from metrics import TRADING_DAYS, compute_metrics
+from optimizer import optimize_portfolio
+from rolling import rolling_analytics, rolling_metrics
+from simulation import default_workers, simulate_portfolio
+
+# Results shared between replicas: the backtest is keyed on the price store
+# versions, which change at every top-up, so older entries are dropped after that
+# long in memory and in the shared store alike; the metrics key fingerprints its
+# inputs, so they stay valid until evicted
+BACKTEST_SHARED_TTL = TOP_UP_INTERVAL
+METRICS_SHARED_TTL = 7 * 24 * 60 * 60
+
+
+# Cache key of a returns series, computed once per run for all the stages using it
+def series_fingerprint(series):
+    """
+    Length and a digest of every date and value, so two series differing in any
+    one value get different keys. Hashing a few thousand rows takes well under
+    a millisecond; the stages below then take the series unhashed.
+    """
+    digest = hashlib.sha256(pd.util.hash_pandas_object(series).to_numpy().tobytes())
+    return (len(series), digest.hexdigest())
+
+
+# The stages below take the series as unhashed (underscore) arguments plus an
+# explicit `key` describing them, built from the inputs of the previous stages
 
 
 # Function to calculate the required metrics
-@st.cache_data(show_spinner=True)
+@instrumented(st.cache_data(show_spinner=True))
+@shared_cache(ttl=METRICS_SHARED_TTL)
 def calculate_metrics(
-    portfolio_returns, benchmark_returns, risk_free_rate=0.0, window=20
+    _portfolio_returns,
+    _benchmark_returns,
+    key,
+    risk_free_rate=0.0,
+    turnover=np.nan,
+    cost_drag=np.nan,
+    periods_per_year=TRADING_DAYS,
 ):
     """
     Calculates various performance and risk metrics for the portfolio.
+    The benchmark is expected on the calendar of the portfolio (see
+    calculate_benchmark_returns), days missing from either are dropped.
+    Turnover and cost drag come from the backtest of the portfolio.
     """
-
-    # Risk Metrics
-    var_95 = portfolio_returns.quantile(0.05) * 100
-    annual_volatility = portfolio_returns.std() * np.sqrt(252) * 100
-    max_drawdown = (portfolio_returns / portfolio_returns.cummax() - 1).min() * 100
-    tracking_error = np.std(portfolio_returns - benchmark_returns) * np.sqrt(252) * 100
-    information_ratio = (
-        (portfolio_returns - benchmark_returns).mean()
-        / (portfolio_returns - benchmark_returns).std()
-        * np.sqrt(252)
+    aligned = pd.concat(
+        [_portfolio_returns, _benchmark_returns], axis=1, join="inner"
+    ).dropna()
+    portfolio_returns = aligned.iloc[:, 0].to_numpy()
+    benchmark_returns = aligned.iloc[:, 1].to_numpy()
+
+    metrics = compute_metrics(
+        portfolio_returns, benchmark_returns, risk_free_rate, periods_per_year
     )
-
-    common_index = portfolio_returns.index.intersection(benchmark_returns.index)
-    portfolio_returns = portfolio_returns.reindex(common_index)
-    benchmark_returns = benchmark_returns.reindex(common_index)
-
-    # # Calculate Rolling Hit Ratio (corrected)
-    # def compare_windows(x):
-    #     # Ensure both windows have the same length
-    #     if len(x) == window:
-    #         return (x > benchmark_returns[x.index].shift(1)).mean()  # Removed .values
-    #     else:
-    #         return np.nan  # Return NaN for incomplete windows
-    #
-    # rolling_hit_ratio = (
-    #     portfolio_returns.rolling(window=window)
-    #     .apply(compare_windows, raw=True)  # Use raw=True for efficiency
-    #     .fillna(method="bfill")
-    #     * 100
-    # )
-    # rolling_hit_ratio = rolling_hit_ratio.iloc[-1]
-
-    portfolio_cummax = (1 + portfolio_returns).cumprod()
-    benchmark_cummax = (1 + benchmark_returns).cumprod()
-    relative_drawdown = (portfolio_cummax / benchmark_cummax - 1).min() * 100
-
-    # Performance Metrics
-    cumulative_returns = (1 + portfolio_returns).cumprod() - 1
-    cumulative_returns = cumulative_returns.iloc[-1] * 100
-    annual_returns = (
-        (1 + portfolio_returns).cumprod().iloc[-1] ** (252 / len(portfolio_returns)) - 1
-    ) * 100
-    sharpe_ratio = (annual_returns / 100 - risk_free_rate) / (annual_volatility / 100)
-
-    # Sortino Ratio
-    downside_returns = portfolio_returns[portfolio_returns < 0]
-    downside_std = downside_returns.std() * np.sqrt(252)
-    sortino_ratio = (annual_returns / 100 - risk_free_rate) / (downside_std)
-
-    # Alpha and Beta
-    covariance_matrix = np.cov(portfolio_returns, benchmark_returns)
-    beta = covariance_matrix[0, 1] / covariance_matrix[1, 1]
-    alpha = (
-        annual_returns / 100 - risk_free_rate - beta * (benchmark_returns.mean() * 252)
+    # Trailing returns, rolling hit ratios and VaR over 1M/1Y/3Y/5Y windows
+    metrics.update(
+        rolling_metrics(portfolio_returns, benchmark_returns, periods_per_year)
     )
-    alpha = alpha * 100
 
-    # Turnover Rate (example calculation - you'll need to adapt this)
-    turnover_data = (
-        np.random.rand(len(portfolio_returns)) * 0.2
-    )  # Random turnover between 0% and 20%
-    turnover_rate = np.mean(turnover_data) * 100
+    # Annual one-way turnover and trading cost drag of the rebalancing schedule
+    metrics["Turnover Rate"] = turnover
+    metrics["Cost Drag"] = cost_drag
+
+    return metrics
 
-    return {
-        "Cumulative Returns": cumulative_returns,
-        "Annual Returns": annual_returns,
-        "Annual Volatility": annual_volatility,
-        "Max Drawdown": max_drawdown,
-        "Sharpe Ratio": sharpe_ratio,
-        "Sortino Ratio": sortino_ratio,
-        "Beta": beta,
-        "Alpha": alpha,
-        "VaR 95%": var_95,
-        "Tracking Error": tracking_error,
-        "Information Ratio": information_ratio,
-        # "Hit Ratio": hit_ratio,
-        # "Rolling Hit Ratio": rolling_hit_ratio,
-        "Relative Drawdown": relative_drawdown,
-        "Turnover Rate": turnover_rate,
-    }
+
+# Benchmark returns on the master calendar of the portfolio
+@instrumented(st.cache_data(show_spinner=True))
+def calculate_benchmark_returns(_benchmark_prices, _portfolio_returns, key):
+    """
+    Aligns the benchmark once on the dates of the portfolio returns, the charts
+    and the metrics reuse the result.
+    """
+    return returns_on_calendar(_benchmark_prices, _portfolio_returns.index)
+
+
+# Rolling series of the portfolio against the benchmark, for charting
+@instrumented(st.cache_data(show_spinner=True))
+def calculate_rolling_analytics(
+    _portfolio_returns, _benchmark_returns, key, periods_per_year=TRADING_DAYS
+):
+    """
+    Returns a DataFrame with the trailing returns, rolling hit ratios and rolling
+    VaR of the portfolio, indexed by date.
+    """
+    aligned = pd.concat(
+        [_portfolio_returns, _benchmark_returns], axis=1, join="inner"
+    ).dropna()
+    series = rolling_analytics(
+        aligned.iloc[:, 0].to_numpy(), aligned.iloc[:, 1].to_numpy(), periods_per_year
+    )
+    return pd.DataFrame(series, index=aligned.index)
+
+
+# Monte Carlo fan of the portfolio value and its simulated tail risk
+@instrumented(st.cache_data(show_spinner=True))
+def calculate_simulation(
+    _portfolio_returns,
+    key,
+    horizon,
+    n_paths,
+    method="bootstrap",
+    seed=0,
+    periods_per_year=TRADING_DAYS,
+):
+    """
+    Simulates n_paths of the portfolio over `horizon` days of its calendar from its
+    daily returns. Large simulations are spread over a process pool.
+    """
+    return simulate_portfolio(
+        _portfolio_returns.dropna().to_numpy(),
+        horizon=horizon,
+        n_paths=n_paths,
+        method=method,
+        seed=seed,
+        workers=default_workers(n_paths, horizon),
+        periods_per_year=periods_per_year,
+    )
 
 
 # Calculate performance from price data
@@ -100,12 +135,79 @@ def calculate_performance(prices):
     return (prices / prices.iloc[0] - 1) * 100  # Return percentage performance
 
 
+# Optimal allocations and efficient frontier for the selected assets
+@instrumented(st.cache_data(show_spinner=True))
+def calculate_optimization(
+    assets, period, versions, risk_free_rate=0.0, policy="ffill"
+):
+    """
+    Computes the covariance matrix once from the aligned returns of the assets
+    and solves for the long-only minimum variance and maximum Sharpe portfolios
+    plus the efficient frontier.
+    """
+    aligned = load_aligned_returns(assets, period, versions, policy)
+    return optimize_portfolio(
+        aligned["returns"].to_numpy(), risk_free_rate, aligned["periods_per_year"]
+    )
+
+
+# Portfolio stage: only the weighting of the cached aligned matrix runs when a
+# weight changes, the prices and the alignment are cache hits
+@instrumented(st.cache_data(show_spinner=True, ttl=BACKTEST_SHARED_TTL))
+@shared_cache(ttl=BACKTEST_SHARED_TTL)
+def calculate_backtest(
+    assets,
+    allocations,
+    period,
+    versions,
+    rebalance="D",
+    band=0.05,
+    cost_bps=0.0,
+    policy="ffill",
+):
+    """
+    Calculates daily portfolio returns from the aligned returns matrix, with the
+    holdings drifting between rebalances. Returns the net returns series, the
+    annual turnover and cost drag (in percent), the annualization factor of
+    the calendar and the cache key of the result for the next stages.
+    `versions` are the store versions of the assets (data.store_versions).
+    """
+    aligned = load_aligned_returns(assets, period, versions, policy)
+    asset_returns = aligned["returns"]
+    result = backtest(
+        asset_returns.to_numpy(),
+        allocations,
+        dates=asset_returns.index,
+        rebalance=rebalance,
+        band=band,
+        cost_bps=cost_bps,
+        periods_per_year=aligned["periods_per_year"],
+    )
+    returns = pd.Series(result["returns"], index=asset_returns.index)
+    return {
+        "returns": returns,
+        "turnover": result["turnover"],
+        "cost_drag": result["cost_drag"],
+        "periods_per_year": aligned["periods_per_year"],
+        "key": (
+            tuple(assets),
+            tuple(allocations),
+            period,
+            rebalance,
+            band,
+            cost_bps,
+            policy,
+            series_fingerprint(returns),
+        ),
+    }
+
+
 # Calculate the weighted returns for the portfolio
-@st.cache_data(show_spinner=True)
-def calculate_weighted_returns(assets, allocations, period):
-    asset_returns = pd.DataFrame()
-    for asset, allocation in zip(assets, allocations):
-        data = fetch_historical_data(asset, period)
-        asset_returns[asset] = data.pct_change() * allocation
-    portfolio_returns = asset_returns.sum(axis=1)
-    return portfolio_returns.dropna()
+def calculate_weighted_returns(assets, allocations, period, rebalance="D"):
+    """
+    Calculates daily portfolio returns, rebalanced to the allocations daily
+    unless another schedule is given.
+    """
+    return calculate_backtest(
+        assets, allocations, period, store_versions(assets), rebalance
+    )["returns"]
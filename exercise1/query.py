@@ -1,22 +1,59 @@
-import streamlit as st
+import pandas as pd
 import yfinance as yf
 
+from common.instrumentation import traced
 
-# Fetch asset data from yfinance
-def fetch_asset_data(ticker):
+# Upper bound for the worker pool yfinance uses when downloading several tickers at once
+MAX_DOWNLOAD_WORKERS = 8
+
+
+# Fetch asset data from yfinance and let errors propagate
+@traced
+def fetch_asset_info(ticker):
     """
-    Fetch asset data using the yfinance API. Returns the long name, symbol, and type of the asset.
+    Fetch asset data using the yfinance API. Returns the long name, symbol, and
+    type of the asset, None values for unknown symbols. Network errors are
+    raised so callers can tell them apart from unknown symbols.
     """
-    try:
-        asset = yf.Ticker(ticker)
-        return (
-            asset.info.get("longName"),
-            asset.info.get("symbol"),
-            asset.info.get("quoteType"),
-        )
-    except Exception as e:
-        st.error(f"Error fetching data for {ticker}: {e}")
-        return None, None, None
+    info = yf.Ticker(ticker).info
+    return (
+        info.get("longName"),
+        info.get("symbol"),
+        info.get("quoteType"),
+    )
+
+
+# Fetch close prices for several tickers in one batched request
+@traced
+def fetch_historical_prices(tickers, period="max", start=None):
+    """
+    Fetch historical close prices for all tickers with a single yf.download call.
+    Returns a wide DataFrame (dates x tickers) aligned on one date index.
+    When start is given it takes precedence over period.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return pd.DataFrame()
+
+    data = yf.download(
+        tickers,
+        period=None if start is not None else period,
+        start=start,
+        auto_adjust=True,  # Same prices as Ticker.history()
+        group_by="column",
+        threads=min(len(tickers), MAX_DOWNLOAD_WORKERS),
+        progress=False,
+    )
+    if data.empty:
+        return pd.DataFrame(columns=tickers, dtype=float)
+    prices = data["Close"]
+    # Older yfinance versions return a Series for a single ticker
+    if isinstance(prices, pd.Series):
+        prices = prices.to_frame(name=tickers[0].upper())
+    # yf.download upper-cases symbols, keep the tickers as the user typed them
+    prices = prices.reindex(columns=[ticker.upper() for ticker in tickers])
+    prices.columns = tickers
+    return prices
 
 
 #   Fetch benchmark data from yfinance
@@ -24,11 +61,10 @@ def fetch_benchmark_data(benchmark_ticker, period):
     """
     Fetch historical benchmark data from yfinance for the selected period.
     """
-    benchmark = yf.Ticker(benchmark_ticker)
-    return benchmark.history(period=period)["Close"]
+    return fetch_historical_data(benchmark_ticker, period)
 
 
 # Fetch historical data from yfinance
 def fetch_historical_data(ticker, period):
-    asset = yf.Ticker(ticker)
-    return asset.history(period=period)["Close"]
+    # Go through the batched path so single series share the same date index as portfolios
+    return fetch_historical_prices([ticker], period)[ticker].dropna()
@@ -0,0 +1,136 @@
+import numpy as np
+
+from metrics import TRADING_DAYS
+
+# Window lengths in trading days
+WINDOWS = {"1M": 21, "1Y": TRADING_DAYS, "3Y": 3 * TRADING_DAYS, "5Y": 5 * TRADING_DAYS}
+# One-sided 95% quantile of the standard normal distribution
+Z_95 = 1.6448536269514722
+
+
+# Window lengths in periods of a calendar with `periods_per_year` (365 for crypto)
+def scaled_windows(periods_per_year=TRADING_DAYS):
+    return {
+        label: round(days * periods_per_year / TRADING_DAYS)
+        for label, days in WINDOWS.items()
+    }
+
+
+# Sum over a sliding window from one cumulative sum
+def rolling_sum(values, window):
+    """
+    Returns the sum of the last `window` values at every position of an array of
+    shape (n,) or (n, k), NaN where the window is incomplete. O(n) for any window.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if window > len(values):
+        return out
+    cumsum = np.cumsum(values, axis=0)
+    out[window - 1] = cumsum[window - 1]
+    out[window:] = cumsum[window:] - cumsum[:-window]
+    return out
+
+
+# Share of days in the window on which the portfolio beat the benchmark
+def rolling_hit_ratio(portfolio_returns, benchmark_returns, window):
+    """
+    Returns the rolling hit ratio in percent. benchmark_returns has shape (n,) and
+    is broadcast against (n,) or (n, k) portfolio returns.
+    """
+    portfolio_returns = np.asarray(portfolio_returns, dtype=float)
+    benchmark_returns = np.asarray(benchmark_returns, dtype=float)
+    if portfolio_returns.ndim == 2:
+        benchmark_returns = benchmark_returns[:, None]
+    hits = (portfolio_returns > benchmark_returns).astype(float)
+    return rolling_sum(hits, window) / window * 100
+
+
+# Compounded return over the trailing window at every date
+def trailing_returns(returns, window):
+    """
+    Returns the compounded return of the last `window` periods at every position,
+    computed from differences of cumulative log returns.
+    """
+    return np.expm1(rolling_sum(np.log1p(np.asarray(returns, dtype=float)), window))
+
+
+# Historical Value at Risk over a holding period
+def historical_var(returns, horizon, level=0.95):
+    """
+    Returns the (1 - level) quantile of all overlapping `horizon`-period returns,
+    one value per column.
+    """
+    returns = np.asarray(returns, dtype=float)
+    if horizon > len(returns):
+        return np.full(returns.shape[1:], np.nan)
+    return np.nanquantile(trailing_returns(returns, horizon), 1 - level, axis=0)
+
+
+# Gaussian Value at Risk of daily returns estimated over a sliding window
+def rolling_parametric_var(returns, window):
+    """
+    Returns the rolling 95% parametric VaR of daily returns. Mean and variance come
+    from running sums of x and x^2, so the cost does not depend on the window.
+    """
+    returns = np.asarray(returns, dtype=float)
+    # Center first to avoid cancellation in the sum of squares
+    offset = np.nanmean(returns, axis=0)
+    centered = returns - offset
+    sums = rolling_sum(centered, window)
+    squares = rolling_sum(centered**2, window)
+    mean = sums / window
+    variance = np.maximum(squares - sums * mean, 0.0) / (window - 1)
+    return offset + mean - Z_95 * np.sqrt(variance)
+
+
+# Rolling series for the portfolio and its benchmark
+def rolling_analytics(
+    portfolio_returns, benchmark_returns, periods_per_year=TRADING_DAYS
+):
+    """
+    Returns a dict of full rolling series (same length as the inputs):
+    trailing 1Y/3Y/5Y returns of portfolio and benchmark, 1Y/3Y rolling hit ratio
+    and the 1Y rolling parametric VaR of the portfolio.
+    """
+    windows = scaled_windows(periods_per_year)
+    series = {}
+    for label in ("1Y", "3Y", "5Y"):
+        window = windows[label]
+        series[f"{label} Return"] = trailing_returns(portfolio_returns, window) * 100
+        series[f"{label} Benchmark Return"] = (
+            trailing_returns(benchmark_returns, window) * 100
+        )
+    for label in ("1Y", "3Y"):
+        series[f"{label} Rolling Hit Ratio"] = rolling_hit_ratio(
+            portfolio_returns, benchmark_returns, windows[label]
+        )
+    series["1Y Rolling VaR 95%"] = (
+        rolling_parametric_var(portfolio_returns, windows["1Y"]) * 100
+    )
+    return series
+
+
+# Latest values of the rolling analytics for the metrics table
+def rolling_metrics(
+    portfolio_returns, benchmark_returns, periods_per_year=TRADING_DAYS
+):
+    """
+    Returns the current trailing returns and rolling hit ratios plus the monthly
+    and annual historical VaR95 of the portfolio, all in percent. Values are NaN
+    when the history is shorter than the window.
+    """
+    windows = scaled_windows(periods_per_year)
+    series = rolling_analytics(portfolio_returns, benchmark_returns, periods_per_year)
+    metrics = {
+        name: float(values[-1]) if len(values) else np.nan
+        for name, values in series.items()
+        if "Benchmark" not in name and "VaR" not in name
+    }
+    metrics["VaR 95% (monthly)"] = (
+        float(historical_var(portfolio_returns, windows["1M"])) * 100
+    )
+    metrics["VaR 95% (annually)"] = (
+        float(historical_var(portfolio_returns, windows["1Y"])) * 100
+    )
+    return metrics
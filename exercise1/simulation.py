@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from metrics import TRADING_DAYS
+
+# Size of one (paths x horizon) float64 array of a chunk. A chunk holds at most two
+# such arrays at once (the resampling indices and the returns turned into wealth)
+CHUNK_BYTES = 16 * 2**20
+# Worker processes of large simulations, each one holds one chunk at a time
+MAX_WORKERS = 4
+# Percentiles shown in the fan chart
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+# Number of points of the fan chart, wealth is only kept at these steps
+FAN_POINTS = 100
+
+
+def _sample_returns(rng, returns, horizon, n_paths, method, block_size):
+    if method == "parametric":
+        return rng.normal(returns.mean(), returns.std(ddof=1), (n_paths, horizon))
+    if block_size <= 1:
+        return returns[rng.integers(0, len(returns), (n_paths, horizon))]
+    # Block bootstrap keeps the short-term autocorrelation of the returns
+    blocks = -(-horizon // block_size)
+    starts = rng.integers(0, len(returns) - block_size + 1, (n_paths, blocks))
+    indices = (starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)
+    return returns[indices[:, :horizon]]
+
+
+def _simulate_chunk(returns, horizon, n_paths, method, block_size, steps, seed):
+    """
+    Simulates one chunk of paths and returns their wealth (starting at 1) at the
+    sampled steps only, as float32 to keep the result small.
+    """
+    rng = np.random.default_rng(seed)
+    log_wealth = _sample_returns(rng, returns, horizon, n_paths, method, block_size)
+    # In place: no further arrays of the size of the draws
+    np.log1p(log_wealth, out=log_wealth)
+    np.cumsum(log_wealth, axis=1, out=log_wealth)
+    return np.exp(log_wealth[:, steps]).astype(np.float32)
+
+
+def chunk_paths(horizon):
+    """
+    Paths per chunk so that one chunk array stays within CHUNK_BYTES.
+    """
+    return max(1, CHUNK_BYTES // (horizon * 8))
+
+
+# Forward simulation of the portfolio
+def simulate_portfolio(
+    returns,
+    horizon=TRADING_DAYS,
+    n_paths=10000,
+    method="bootstrap",
+    block_size=1,
+    seed=0,
+    workers=1,
+    level=0.95,
+    periods_per_year=TRADING_DAYS,
+):
+    """
+    Simulates n_paths of the portfolio over `horizon` periods by resampling the
+    historical returns (method="bootstrap", optionally in blocks) or drawing from
+    a normal distribution fitted to them (method="parametric").
+
+    Paths are generated in vectorized chunks of chunk_paths(horizon) paths, so a
+    chunk needs about 2 x CHUNK_BYTES whatever the horizon. Each chunk gets its own
+    child of one SeedSequence, so the result only depends on the seed, not on the
+    number of workers; with workers > 1 chunks run in a process pool.
+
+    Returns the wealth percentiles over time (starting at 1) and the simulated VaR
+    and CVaR of the return over the whole horizon, in percent.
+    """
+    returns = np.ascontiguousarray(returns, dtype=float)
+    returns = returns[~np.isnan(returns)]
+    steps = np.unique(np.linspace(0, horizon - 1, FAN_POINTS).astype(int))
+    chunk_size = chunk_paths(horizon)
+    chunk_sizes = [chunk_size] * (n_paths // chunk_size)
+    if n_paths % chunk_size:
+        chunk_sizes.append(n_paths % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    arguments = [
+        (returns, horizon, size, method, block_size, steps, chunk_seed)
+        for size, chunk_seed in zip(chunk_sizes, seeds)
+    ]
+
+    if workers > 1 and len(chunk_sizes) > 1:
+        # Spawned workers do not inherit the threads of the Streamlit server
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunk_sizes)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            chunks = list(executor.map(_simulate_chunk, *zip(*arguments)))
+    else:
+        chunks = [_simulate_chunk(*chunk_arguments) for chunk_arguments in arguments]
+    wealth = np.concatenate(chunks)
+
+    terminal_returns = wealth[:, -1].astype(float) - 1
+    var = np.quantile(terminal_returns, 1 - level)
+    cvar = terminal_returns[terminal_returns <= var].mean()
+    return {
+        "steps": steps + 1,
+        "percentiles": {
+            percentile: values
+            for percentile, values in zip(
+                FAN_PERCENTILES, np.percentile(wealth, FAN_PERCENTILES, axis=0)
+            )
+        },
+        "VaR": var * 100,
+        "CVaR": cvar * 100,
+        "paths": n_paths,
+        "horizon": horizon,
+        "years": horizon / periods_per_year,
+    }
+
+
+def default_workers(n_paths, horizon):
+    """
+    Up to MAX_WORKERS cores for simulations of several chunks, which bounds the
+    memory to about MAX_WORKERS x 2 x CHUNK_BYTES. A pool is not worth starting for
+    small simulations.
+    """
+    if n_paths <= 2 * chunk_paths(horizon):
+        return 1
+    return min(os.cpu_count() or 1, MAX_WORKERS)
@@ -0,0 +1,66 @@
+import os
+
+import plotly.io as pio
+import streamlit as st
+
+from common.instrumentation import instrumented
+from fig import create_large_data_chart, create_random_chart
+
+ARTIFACT_DIR = os.environ.get(
+    "ARTIFACT_DIR", os.path.join(os.path.dirname(__file__), "artifacts")
+)
+
+# The heavy charts do not depend on user input, so they are built once (at image build
+# time with `python artifacts.py`) and stored as Plotly JSON. The app only reads them.
+# Artifact name -> function building its figure
+ARTIFACTS = {
+    "large_chart": lambda: create_large_data_chart(
+        title="Complex Calculation Result (FFT)"
+    ),
+    "random_chart_1": lambda: create_random_chart(title="Random Chart 1"),
+    "random_chart_2": lambda: create_random_chart(title="Random Chart 2"),
+}
+
+
+def artifact_path(name: str) -> str:
+    return os.path.join(ARTIFACT_DIR, f"{name}.json")
+
+
+def artifacts_ready() -> bool:
+    return all(os.path.exists(artifact_path(name)) for name in ARTIFACTS)
+
+
+def save_artifact(name: str, fig):
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    path = artifact_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # orjson (in requirements) is used by plotly for compact, fast encoding
+    with open(tmp_path, "w") as file:
+        file.write(pio.to_json(fig, validate=False, engine="auto"))
+    os.replace(tmp_path, path)
+
+
+def build_artifacts():
+    """
+    Build and store every artifact, used as the warm-up step before deploying.
+    """
+    for name, build in ARTIFACTS.items():
+        save_artifact(name, build())
+        print(f"Built artifact {artifact_path(name)}")
+
+
+# Loaded once per server process and shared by all sessions
+@instrumented(st.cache_resource(show_spinner=False))
+def load_artifact(name: str):
+    """
+    Return the prebuilt figure, building and storing it first if it is missing.
+    """
+    path = artifact_path(name)
+    if not os.path.exists(path):
+        save_artifact(name, ARTIFACTS[name]())
+    with open(path) as file:
+        return pio.from_json(file.read(), skip_invalid=True)
+
+
+if __name__ == "__main__":
+    build_artifacts()
@@ -0,0 +1,140 @@
+"""
+Backfill the local candle store with exchange history.
+
+    python backfill.py BTC/USDT ETH/USDT --days 90         # 1m candles of the last 90 days
+    python backfill.py BTC/USDT --timeframe 1h --days 730
+    EXCHANGE_ID=fake python backfill.py BTC/USDT --days 7  # offline, FakeExchange
+
+Pages through the history with `since` cursors and saves the cursor with every
+page, so an interrupted run (or the next scheduled one) continues where the last
+one stopped. Run it periodically to keep the store current.
+"""
+
+import argparse
+import time
+
+from client import AsyncExchangeClient
+from data import EXCHANGE_ID, MAX_FETCH_LIMIT, create_exchange_client
+from fake_exchange import TIMEFRAME_MS
+from query import CandleStore
+
+# Attempts per page before giving up, transient network errors are common
+PAGE_RETRIES = 3
+RETRY_DELAY = 2.0
+
+
+def _fetch_page(
+    client: AsyncExchangeClient, symbol: str, timeframe: str, since: int, limit: int
+) -> list:
+    for attempt in range(PAGE_RETRIES):
+        try:
+            return client.run(
+                client.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+            )
+        except Exception:
+            if attempt == PAGE_RETRIES - 1:
+                raise
+            time.sleep(RETRY_DELAY * 2**attempt)
+
+
+def _page_through(
+    store: CandleStore,
+    client: AsyncExchangeClient,
+    key: tuple[str, str, str],
+    cursor: int,
+    until: int,
+    limit: int,
+    state_start: int | None,
+    progress=None,
+) -> int:
+    """
+    Fetch and store pages from `cursor` up to `until`. With `state_start`, the
+    backfill state (state_start, next cursor) is saved with every page.
+    """
+    _, symbol, timeframe = key
+    step = TIMEFRAME_MS[timeframe]
+    written = 0
+    while cursor < until:
+        page = _fetch_page(client, symbol, timeframe, cursor, limit)
+        page = [row for row in page if cursor <= row[0] < until]
+        if not page:
+            break
+        last_timestamp = int(page[-1][0])
+        # The still-forming candle is stored but fetched again by the next run
+        closed = last_timestamp + step <= client.exchange.milliseconds()
+        next_cursor = last_timestamp + step if closed else last_timestamp
+        state = None if state_start is None else (state_start, next_cursor)
+        written += store.write(*key, page, cursor=state)
+        if progress is not None:
+            progress(symbol, timeframe, next_cursor, written)
+        if not closed:
+            break
+        cursor = next_cursor
+    return written
+
+
+def backfill(
+    store: CandleStore,
+    client: AsyncExchangeClient,
+    symbol: str,
+    timeframe: str = "1m",
+    since: int | None = None,
+    until: int | None = None,
+    exchange_id: str = EXCHANGE_ID,
+    limit: int = MAX_FETCH_LIMIT,
+    progress=None,
+) -> int:
+    """
+    Store the candles of (symbol, timeframe) from `since` up to `until` (ms,
+    default now). Continues from the saved cursor when this range was partly
+    backfilled before, history older than the stored range is fetched first.
+    Returns the number of candles written.
+    """
+    key = (exchange_id, symbol, timeframe)
+    until = until or client.exchange.milliseconds()
+    state = store.backfill_state(*key)
+    if state is None:
+        if since is None:
+            raise ValueError("`since` is required for the first backfill")
+        return _page_through(store, client, key, since, until, limit, since, progress)
+
+    start, cursor = state
+    written = 0
+    if since is not None and since < start:
+        # Older history: the state only moves its start once this part is complete
+        written += _page_through(
+            store, client, key, since, start, limit, None, progress
+        )
+        store.write(*key, [], cursor=(since, cursor))
+        start = since
+    return written + _page_through(
+        store, client, key, cursor, until, limit, start, progress
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--timeframe", default="1m", choices=TIMEFRAME_MS)
+    parser.add_argument("--days", type=float, default=30)
+    args = parser.parse_args()
+
+    store = CandleStore()
+    client = create_exchange_client()
+
+    def progress(symbol, timeframe, cursor, written):
+        day = time.strftime("%Y-%m-%d %H:%M", time.gmtime(cursor / 1000))
+        print(f"\r{symbol} {timeframe}: {written} candles, up to {day}", end="")
+
+    try:
+        since = client.exchange.milliseconds() - int(args.days * 24 * 60 * 60 * 1000)
+        for symbol in args.symbols:
+            backfill(store, client, symbol, args.timeframe, since, progress=progress)
+            _, _, count = store.coverage(EXCHANGE_ID, symbol, args.timeframe)
+            print(f"\n{symbol} {args.timeframe}: {count} candles stored")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Offline benchmarks of the dashboard hot paths.
+
+    python benchmark.py                          # all sizes, recorded or synthetic candles
+    python benchmark.py --sizes 100 1000 --repeat 5
+    python benchmark.py --record BTC/USDT --candles 10000   # record candles once
+
+Candles come from benchmark_fixtures/ohlcv.json when they were recorded, otherwise
+from the deterministic FakeExchange. Full script runs use EXCHANGE_ID=fake, so
+nothing is requested from an exchange while timing. Every run appends one line to
+benchmark_results.jsonl and is compared with the previous one.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_PATH = os.path.join(HERE, "benchmark_fixtures", "ohlcv.json")
+RESULTS_PATH = os.path.join(HERE, "benchmark_results.jsonl")
+# Numbers of 1m candles the functions are timed with
+SIZES = [100, 1000, 10000]
+# Candle counts offered by the "Number of Candles" select box
+APP_CANDLE_COUNTS = [100, 500, 1000]
+# Fixed clock of the synthetic candles, so every run times the same data
+FIXTURE_CLOCK = 1_700_000_000.0
+
+
+def record_fixture(symbol: str, candles: int):
+    """
+    Page through the exchange history once and keep the last `candles` 1m candles.
+    """
+    import ccxt
+
+    exchange = ccxt.binance()
+    since = exchange.milliseconds() - candles * 60_000
+    ohlcv = []
+    while len(ohlcv) < candles:
+        page = exchange.fetch_ohlcv(symbol, "1m", since=since, limit=1000)
+        if not page:
+            break
+        ohlcv.extend(page)
+        since = page[-1][0] + 60_000
+    os.makedirs(os.path.dirname(FIXTURE_PATH), exist_ok=True)
+    with open(FIXTURE_PATH, "w") as file:
+        json.dump({"symbol": symbol, "ohlcv": ohlcv[-candles:]}, file)
+    print(f"Recorded {len(ohlcv[-candles:])} candles of {symbol} to {FIXTURE_PATH}")
+
+
+def fixture_ohlcv(candles: int) -> list:
+    """
+    The last `candles` recorded candles (repeated back in time when fewer were
+    recorded), or as many candles of the FakeExchange random walk.
+    """
+    if os.path.exists(FIXTURE_PATH):
+        with open(FIXTURE_PATH) as file:
+            recorded = json.load(file)["ohlcv"]
+        repeats = -(-candles // len(recorded))
+        ohlcv = (recorded * repeats)[-candles:]
+        start = recorded[-1][0] - (candles - 1) * 60_000
+        return [[start + i * 60_000, *row[1:]] for i, row in enumerate(ohlcv)]
+
+    from fake_exchange import FakeExchange
+
+    exchange = FakeExchange(latency=0, clock=lambda: FIXTURE_CLOCK)
+    return asyncio.run(exchange.fetch_ohlcv("BTC/USDT", "1m", limit=candles))
+
+
+def to_frame(ohlcv: list) -> pd.DataFrame:
+    # Same layout as the history and live frames
+    data = pd.DataFrame(
+        ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"]
+    )
+    data["timestamp"] = pd.to_datetime(data["timestamp"], unit="ms")
+    return data
+
+
+def timed(function, repeat: int, setup=None) -> dict:
+    """
+    Best and median wall time of `repeat` calls, in milliseconds.
+    `setup` runs before each call outside the timing (e.g. to clear caches).
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": round(min(times), 3),
+        "median_ms": round(float(np.median(times)), 3),
+    }
+
+
+def clear_caches():
+    import streamlit as st
+
+    from common.shared_cache import default_backend
+
+    st.cache_data.clear()
+    # The shared cache sits below st.cache_data, a cold run must miss there too
+    backend = default_backend()
+    if backend is not None:
+        backend.clear()
+
+
+def benchmark_functions(candles: int, repeat: int) -> dict:
+    """
+    Time the indicator, figure and candle buffer code with `candles` candles.
+    """
+    from buffer import CandleBuffer
+    from fig import LiveFigure, create_figure
+    from processing import calculate_indicators, selected_indicators
+
+    ohlcv = fixture_ohlcv(candles + 1)
+    data = to_frame(ohlcv[:-1])
+    flags = dict(ema_12=True, ema_26=True, bollinger=True)
+    with_indicators = calculate_indicators(data, window=20, **flags)
+
+    # One tick: the next candle arrives in a full buffer with indicators attached
+    state = {}
+
+    def fill_buffer():
+        buffer = CandleBuffer(capacity=candles)
+        keys = [
+            buffer.add_indicator(indicator)
+            for indicator in selected_indicators(window=20, **flags)
+        ]
+        buffer.extend(ohlcv[:-1])
+        live = LiveFigure(None, buffer.to_frame(keys), candles, **flags)
+        state.update(buffer=buffer, keys=keys, live=live)
+
+    def tick():
+        state["buffer"].extend(ohlcv[-1:])
+        live = state["live"]
+        live.patch(state["buffer"].to_frame(state["keys"], since=live.last_timestamp))
+
+    return {
+        "calculate_indicators": timed(
+            lambda: calculate_indicators(data, window=20, **flags), repeat
+        ),
+        "create_figure": timed(lambda: create_figure(with_indicators, **flags), repeat),
+        "create_figure.to_json": {
+            **timed(lambda: create_figure(with_indicators, **flags).to_json(), repeat),
+            # Size of the figure sent to the browser
+            "payload_kb": round(
+                len(create_figure(with_indicators, **flags).to_json()) / 1024, 1
+            ),
+        },
+        "buffer.extend_tick": timed(
+            lambda: state["buffer"].extend(ohlcv[-1:]), repeat, fill_buffer
+        ),
+        "live_figure.tick": timed(tick, repeat, fill_buffer),
+    }
+
+
+def incremental_difference(
+    name: str, timestamps: np.ndarray, values: np.ndarray, **params
+) -> dict:
+    """
+    Largest relative difference per column between bootstrap() over all candles
+    and bootstrap() over the first half followed by update() for the rest. Each
+    streamed candle first arrives as a different forming candle and is then
+    replaced by its final values, like the live feed does. Should be ~0.
+    """
+    from indicators import CLOSE, HIGH, VOLUME, make_indicator
+
+    expected = make_indicator(name, **params).bootstrap(timestamps, values)
+    indicator = make_indicator(name, **params)
+    split = len(timestamps) // 2
+    streamed = {
+        column: np.concatenate(
+            [np.asarray(outputs, dtype=float), np.full(len(timestamps) - split, np.nan)]
+        )
+        for column, outputs in indicator.bootstrap(
+            timestamps[:split], values[:split]
+        ).items()
+    }
+    for position in range(split, len(timestamps)):
+        forming = values[position].copy()
+        forming[[HIGH, CLOSE, VOLUME]] *= (1.01, 1.005, 0.5)
+        indicator.update(timestamps[position], forming, True)
+        outputs = indicator.update(timestamps[position], values[position], False)
+        for column, value in outputs.items():
+            streamed[column][position] = value
+    differences = {}
+    for column, outputs in expected.items():
+        outputs = np.asarray(outputs, dtype=float)
+        if not np.array_equal(np.isnan(outputs), np.isnan(streamed[column])):
+            differences[column] = np.inf
+            continue
+        valid = ~np.isnan(outputs)
+        scale = np.maximum(np.abs(outputs[valid]), 1.0)
+        error = np.abs(outputs[valid] - streamed[column][valid]) / scale
+        differences[column] = float(error.max()) if len(error) else 0.0
+    return differences
+
+
+def check_indicators(candles: int, tolerance: float = 1e-8):
+    """
+    Fail unless every indicator streamed candle by candle gives the same values as
+    its vectorized bootstrap, the premise of the O(1) updates timed below.
+    """
+    from indicators import INDICATORS
+
+    rows = np.asarray(fixture_ohlcv(candles), dtype=float)
+    timestamps, values = rows[:, 0].astype(np.int64), rows[:, 1:]
+    for name in INDICATORS:
+        differences = incremental_difference(name, timestamps, values)
+        worst = max(differences.values())
+        if worst > tolerance:
+            raise SystemExit(
+                f"{name}: update() differs from bootstrap(): {differences}"
+            )
+        print(f"  {name:<32} update() matches bootstrap() ({worst:.1e})")
+
+
+def benchmark_charts(repeat: int) -> dict:
+    """
+    Time the heavy charts: building them and loading the prebuilt artifacts.
+    """
+    from artifacts import ARTIFACTS, build_artifacts, load_artifact
+    from fig import create_large_data_chart
+
+    def load_all():
+        load_artifact.clear()
+        for name in ARTIFACTS:
+            load_artifact(name)
+
+    build_artifacts()
+    return {
+        "create_large_data_chart.cold": timed(
+            lambda: create_large_data_chart(title="Benchmark"), repeat, clear_caches
+        ),
+        "create_large_data_chart.warm": timed(
+            lambda: create_large_data_chart(title="Benchmark"), repeat
+        ),
+        "load_artifacts": timed(load_all, repeat),
+    }
+
+
+def benchmark_app(candle_count: int, repeat: int) -> dict:
+    """
+    Time full script runs of main.py through AppTest against the FakeExchange:
+    the first run of a session and a rerun without changes.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    apps = []
+
+    def first_run():
+        app = AppTest.from_file(os.path.join(HERE, "main.py"), default_timeout=120)
+        app.session_state["candle_count"] = candle_count
+        apps.append(app.run())
+
+    results = {
+        "app.first_run": timed(first_run, repeat),
+        "app.rerun": timed(lambda: apps[-1].run(), repeat),
+    }
+    errors = [app.exception for app in apps if app.exception]
+    if errors:
+        raise RuntimeError(f"main.py raised during the benchmark: {errors[0]}")
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results() -> dict:
+    if not os.path.exists(RESULTS_PATH):
+        return {}
+    with open(RESULTS_PATH) as file:
+        lines = file.read().splitlines()
+    return json.loads(lines[-1])["results"] if lines else {}
+
+
+def report(results: dict, previous: dict):
+    for size, timings in results.items():
+        print(f"\n{size}")
+        for name, timing in timings.items():
+            line = f"  {name:<32} {timing['median_ms']:>10.2f} ms"
+            before = previous.get(size, {}).get(name)
+            if before:
+                line += f"  ({timing['median_ms'] / before['median_ms']:.2f}x previous)"
+            if "payload_kb" in timing:
+                line += f"  {timing['payload_kb']} KB"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-app", action="store_true", help="skip AppTest runs")
+    parser.add_argument("--record", metavar="SYMBOL")
+    parser.add_argument("--candles", type=int, default=max(SIZES))
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture(args.record, args.candles)
+        return
+
+    # These are read when data.py, query.py, artifacts.py and shared_cache.py are
+    # imported, so set them first; the pollers write to a throwaway candle store
+    # and shared cache
+    os.environ["EXCHANGE_ID"] = "fake"
+    os.environ["ARTIFACT_DIR"] = tempfile.mkdtemp(prefix="artifacts_")
+    os.environ["CANDLE_STORE_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="candles_"), "crypto.db"
+    )
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="shared_cache_"), "cache.sqlite"
+    )
+    os.chdir(HERE)
+    from streamlit.logger import set_log_level
+
+    set_log_level("error")
+
+    print("indicators")
+    check_indicators(max(args.sizes))
+    results = {"charts": benchmark_charts(args.repeat)}
+    for candles in args.sizes:
+        results[f"{candles} candles"] = benchmark_functions(candles, args.repeat)
+        if not args.no_app and candles in APP_CANDLE_COUNTS:
+            results[f"{candles} candles"].update(benchmark_app(candles, args.repeat))
+
+    previous = previous_results()
+    report(results, previous)
+    with open(RESULTS_PATH, "a") as file:
+        entry = {
+            "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "fixture": "recorded" if os.path.exists(FIXTURE_PATH) else "synthetic",
+            "repeat": args.repeat,
+            "results": results,
+        }
+        file.write(json.dumps(entry) + "\n")
+    print(f"\nResults appended to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
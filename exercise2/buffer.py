@@ -0,0 +1,140 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from indicators import Indicator
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+class CandleBuffer:
+    """
+    Fixed-capacity ring buffer of OHLCV candles for one (coin, timeframe).
+    New candles overwrite the oldest ones, the still-forming last candle is
+    updated in place, so memory stays constant however long the app runs.
+    Attached indicators are updated incrementally with every candle change and
+    their values are kept in ring columns aligned with the candles.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)  # Milliseconds
+        self.values = np.zeros((capacity, len(OHLCV_COLUMNS)), dtype=np.float64)
+        self.size = 0
+        self.end = 0  # Position the next new candle is written to
+        # Incremented on every change, lets readers skip work when nothing happened
+        self.version = 0
+        self.lock = threading.RLock()
+        self.indicators: dict[str, Indicator] = {}
+        self.indicator_values: dict[str, dict[str, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def first_timestamp(self) -> int | None:
+        if not self.size:
+            return None
+        return int(self.timestamps[(self.end - self.size) % self.capacity])
+
+    @property
+    def last_timestamp(self) -> int | None:
+        if not self.size:
+            return None
+        return int(self.timestamps[(self.end - 1) % self.capacity])
+
+    def extend(self, ohlcv: list) -> int:
+        """
+        Adds candles given as [timestamp, open, high, low, close, volume] rows in
+        ascending time order. A row with the timestamp of the last candle replaces
+        it, older rows are ignored. Returns the number of new candles appended.
+        """
+        appended = 0
+        with self.lock:
+            for row in ohlcv:
+                timestamp = int(row[0])
+                last_timestamp = self.last_timestamp
+                if last_timestamp is not None and timestamp < last_timestamp:
+                    continue
+                is_new = timestamp != last_timestamp
+                if is_new:
+                    position = self.end
+                    self.end = (self.end + 1) % self.capacity
+                    self.size = min(self.size + 1, self.capacity)
+                    appended += 1
+                else:
+                    position = (self.end - 1) % self.capacity
+                self.timestamps[position] = timestamp
+                self.values[position] = row[1:6]
+                for key, indicator in self.indicators.items():
+                    outputs = indicator.update(timestamp, self.values[position], is_new)
+                    for column, value in outputs.items():
+                        self.indicator_values[key][column][position] = value
+            if ohlcv:
+                self.version += 1
+        return appended
+
+    def add_indicator(self, indicator: Indicator) -> str:
+        """
+        Attach an indicator, bootstrapping it over the held candles if it is not
+        attached yet. Returns its key, to be passed to to_frame().
+        """
+        with self.lock:
+            if indicator.key not in self.indicators:
+                positions = self.positions()
+                outputs = indicator.bootstrap(
+                    self.timestamps[positions], self.values[positions]
+                )
+                columns = {}
+                for column in indicator.columns:
+                    columns[column] = np.full(self.capacity, np.nan)
+                    columns[column][positions] = outputs[column]
+                self.indicators[indicator.key] = indicator
+                self.indicator_values[indicator.key] = columns
+        return indicator.key
+
+    def positions(self) -> np.ndarray:
+        """
+        Returns the ring positions of the held candles from oldest to newest.
+        """
+        return (self.end - self.size + np.arange(self.size)) % self.capacity
+
+    def tail_positions(self, since: int) -> np.ndarray:
+        """
+        Returns the ring positions of the candles with timestamp >= since, oldest
+        first. Walks back from the newest candle, so the cost depends on the number
+        of returned candles and not on the capacity.
+        """
+        count = 0
+        while (
+            count < self.size
+            and self.timestamps[(self.end - 1 - count) % self.capacity] >= since
+        ):
+            count += 1
+        return (self.end - count + np.arange(count)) % self.capacity
+
+    def to_frame(
+        self, indicator_keys=(), since: int | None = None, count: int | None = None
+    ) -> pd.DataFrame:
+        """
+        Returns a copy of the held candles as an OHLCV DataFrame, oldest first,
+        with the columns of the requested indicators. With `since` (milliseconds)
+        only the candles from that timestamp on are returned, with `count` only
+        the last `count` candles.
+        """
+        with self.lock:
+            if since is not None:
+                positions = self.tail_positions(since)
+            else:
+                positions = self.positions()
+            if count is not None:
+                positions = positions[-count:]
+            data = pd.DataFrame(self.values[positions], columns=OHLCV_COLUMNS)
+            data.insert(
+                0, "timestamp", pd.to_datetime(self.timestamps[positions], unit="ms")
+            )
+            for key in indicator_keys:
+                for column, values in self.indicator_values[key].items():
+                    data[column] = values[positions]
+        return data
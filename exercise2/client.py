@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import ccxt.async_support as ccxt_async
+
+
+class AsyncExchangeClient:
+    """
+    Concurrent OHLCV client around one async ccxt exchange instance.
+
+    The exchange (and its HTTP session) is created once and reused for every
+    request. Requests run on a private event loop in a background thread, so the
+    poller threads of all coins share it and their requests run concurrently.
+    ccxt's built-in throttler spaces requests by the exchange's rateLimit and a
+    semaphore caps the number of requests in flight.
+    """
+
+    def __init__(self, exchange_id: str = "binance", exchange=None, max_concurrency=5):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.exchange = exchange or getattr(ccxt_async, exchange_id)(
+            {"enableRateLimit": True}
+        )
+        self.semaphore = self.run(self._create_semaphore(max_concurrency))
+
+    @staticmethod
+    async def _create_semaphore(max_concurrency):
+        # Created inside the loop it is used from
+        return asyncio.Semaphore(max_concurrency)
+
+    def run(self, coroutine, timeout: float | None = None):
+        """
+        Run a coroutine on the client's event loop and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    async def fetch_ohlcv(
+        self, symbol: str, timeframe: str = "1m", since=None, limit=None
+    ) -> list:
+        async with self.semaphore:
+            return await self.exchange.fetch_ohlcv(
+                symbol, timeframe=timeframe, since=since, limit=limit
+            )
+
+    def close(self):
+        self.run(self.exchange.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -1,29 +1,155 @@
-import ccxt
+import os
+from typing import Callable
+
 import pandas as pd
 import streamlit as st
 
+from buffer import OHLCV_COLUMNS, CandleBuffer
+from client import AsyncExchangeClient
+from common.instrumentation import instrumented, traced
+from common.shared_cache import shared_cache
+from fake_exchange import TIMEFRAME_MS, FakeExchange
+from processing import history_timeframe, resample_candles
+from query import CandleStore
+
+
+# Maximum number of candles Binance returns per request
+MAX_FETCH_LIMIT = 1000
+# Replicas polling the same candles within this many seconds share one request
+FETCH_SHARED_TTL = 1.0
+
+# Exchange used by the live chart, "fake" runs against the local FakeExchange
+EXCHANGE_ID = os.environ.get("EXCHANGE_ID", "binance")
+# Pairs offered in the sidebar, the comparison measures them against the first
+COINS = [
+    "BTC/USDT",
+    "ETH/USDT",
+    "LTC/USDT",
+    "BNB/USDT",
+    "SOL/USDT",
+    "XRP/USDT",
+    "ADA/USDT",
+    "DOGE/USDT",
+    "AVAX/USDT",
+    "DOT/USDT",
+    "LINK/USDT",
+    "TRX/USDT",
+    "BCH/USDT",
+    "ATOM/USDT",
+    "UNI/USDT",
+    "XLM/USDT",
+    "ETC/USDT",
+    "FIL/USDT",
+    "NEAR/USDT",
+    "APT/USDT",
+    "ARB/USDT",
+    "OP/USDT",
+    "INJ/USDT",
+    "SUI/USDT",
+]
+# Candles the history chart shows at most, longer ranges use longer candles
+HISTORY_MAX_CANDLES = 1000
+
+
+def create_exchange_client(exchange_id: str = EXCHANGE_ID) -> AsyncExchangeClient:
+    if exchange_id == "fake":
+        return AsyncExchangeClient(exchange=FakeExchange())
+    return AsyncExchangeClient(exchange_id)
+
 
-exchange = ccxt.binance()
+# One async client per process: its HTTP session and rate limiter are shared by all sessions
+@instrumented(st.cache_resource)
+def exchange_client() -> AsyncExchangeClient:
+    return create_exchange_client()
 
 
-# Added st.cache_data decorator to fetch_binance_ohlcv function to cache the data and improve the performance of the application.
-# show_spinner parameter is set to True to display a spinner while the data is being fetched.
-@st.cache_data(show_spinner=True)
-def fetch_binance_ohlcv(  # Renamed fetch_ohlcv to fetch_binance_ohlcv to be more precise what exchange is used.
-    coin: str, timeframe: str = "1m", limit: int = 100
-) -> pd.DataFrame:
+def _buffer_request(buffer: CandleBuffer, coin: str, timeframe: str) -> dict:
+    # An empty buffer is filled with the last `capacity` candles, afterwards only
+    # candles from the last held timestamp on are requested, which re-delivers the
+    # still-forming candle plus any new ones
+    since = buffer.last_timestamp
+    if since is None:
+        limit = min(buffer.capacity, MAX_FETCH_LIMIT)
+    else:
+        limit = MAX_FETCH_LIMIT
+    return {"symbol": coin, "timeframe": timeframe, "since": since, "limit": limit}
 
-    try:
-        # Added try-except block to handle exceptions when fetching data.
-        ohlcv = exchange.fetch_ohlcv(coin, timeframe=timeframe, limit=limit)
-        data = pd.DataFrame(
-            ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"]
+
+# Candles from the exchange, shared with the other replicas' pollers; the client is
+# not part of the key and errors are raised, so they are not shared
+@shared_cache(ttl=FETCH_SHARED_TTL)
+def fetch_candles(
+    exchange_id: str,
+    symbol: str,
+    timeframe: str,
+    since: int | None,
+    limit: int,
+    _client: AsyncExchangeClient,
+) -> list:
+    return _client.run(
+        _client.fetch_ohlcv(
+            symbol=symbol, timeframe=timeframe, since=since, limit=limit
         )
-        data["timestamp"] = pd.to_datetime(data["timestamp"], unit="ms")
-        return data
-
-    except Exception as e:
-        error_message = f"Error fetching data: {str(e)}"
-        # Return dataframe with the error message
-        error_df = pd.DataFrame({"error": [error_message]})
-        return error_df
+    )
+
+
+@traced
+def update_candle_buffer(
+    buffer: CandleBuffer,
+    coin: str,
+    timeframe: str = "1m",
+    client: AsyncExchangeClient | None = None,
+    on_page: Callable[[int | None], None] | None = None,
+) -> int:
+    """
+    Bring one ring buffer up to date. A buffer further behind than one request
+    reaches (e.g. after a long pause) is paged forward until a page comes back
+    short, so no hole is left before the newest candles. `on_page(since)` runs
+    after every page with the last timestamp held before it, e.g. to persist the
+    page before the next one evicts it. Returns the number of new candles;
+    exceptions are left to the caller. Background threads pass the client
+    explicitly instead of going through st.cache_resource.
+    """
+    client = client or exchange_client()
+    appended = 0
+    while True:
+        since = buffer.last_timestamp
+        request = _buffer_request(buffer, coin, timeframe)
+        ohlcv = fetch_candles(EXCHANGE_ID, **request, _client=client)
+        appended += buffer.extend(ohlcv)
+        if on_page is not None:
+            on_page(since)
+        # An empty buffer is filled with the newest candles in one request
+        if since is None or len(ohlcv) < request["limit"]:
+            return appended
+        if buffer.last_timestamp == since:
+            return appended  # A full page that does not move forward, stop here
+
+
+# One store connection per thread, shared by all sessions of the process
+@instrumented(st.cache_resource)
+def candle_store() -> CandleStore:
+    return CandleStore()
+
+
+@traced
+def load_history(
+    coin: str, days: float, max_candles: int = HISTORY_MAX_CANDLES
+) -> tuple[pd.DataFrame, str]:
+    """
+    The last `days` of backfilled 1m candles up to the newest stored one, read
+    from the candle store without calling the exchange and resampled to the
+    shortest timeframe that fits in `max_candles`. Returns the candles and the
+    timeframe, an empty frame when nothing was backfilled.
+    """
+    store = candle_store()
+    _, last, _ = store.coverage(EXCHANGE_ID, coin, "1m")
+    if last is None:
+        return pd.DataFrame(columns=["timestamp", *OHLCV_COLUMNS]), "1m"
+    span = int(days * TIMEFRAME_MS["1d"])
+    timestamps, values = store.read(EXCHANGE_ID, coin, "1m", last - span, last)
+    timeframe = history_timeframe(span, max_candles)
+    timestamps, values = resample_candles(timestamps, values, TIMEFRAME_MS[timeframe])
+    data = pd.DataFrame(values, columns=OHLCV_COLUMNS)
+    data.insert(0, "timestamp", pd.to_datetime(timestamps, unit="ms"))
+    return data, timeframe
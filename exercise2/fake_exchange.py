@@ -0,0 +1,80 @@
+import asyncio
+import time
+import zlib
+
+import numpy as np
+
+# Length of each supported timeframe in milliseconds
+TIMEFRAME_MS = {
+    "1m": 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "1h": 60 * 60_000,
+    "4h": 4 * 60 * 60_000,
+    "1d": 24 * 60 * 60_000,
+}
+
+
+class FakeExchange:
+    """
+    Local stand-in for an async ccxt exchange, for tests and offline development.
+    Candles are a deterministic random walk per symbol derived from the candle
+    timestamp, so repeated requests agree with each other, and the last candle is
+    still forming: its close moves with the wall clock. Every request sleeps for
+    `latency` seconds to mimic a network round trip.
+    """
+
+    id = "fake"
+
+    def __init__(self, latency: float = 0.05, rate_limit: int = 0, clock=time.time):
+        self.latency = latency
+        self.rateLimit = rate_limit  # Milliseconds between requests, like ccxt
+        self.clock = clock
+        self.requests = 0
+
+    def milliseconds(self) -> int:
+        # Current time of the exchange, like ccxt
+        return int(self.clock() * 1000)
+
+    @staticmethod
+    def _seed(symbol: str) -> int:
+        return zlib.crc32(symbol.encode())
+
+    def _candles(self, symbol: str, timeframe: str, start: int, count: int) -> list:
+        step = TIMEFRAME_MS[timeframe]
+        now = int(self.clock() * 1000)
+        timestamps = start + step * np.arange(count, dtype=np.int64)
+        timestamps = timestamps[timestamps <= now]
+        base = 100 + self._seed(symbol) % 1000
+        candles = []
+        for timestamp in timestamps:
+            rng = np.random.default_rng([self._seed(symbol), int(timestamp)])
+            # Price level is a smooth function of time so neighbouring candles connect
+            level = base * (1 + 0.05 * np.sin(timestamp / (step * 500)))
+            open_, close = level * (1 + rng.normal(0, 0.002, 2))
+            if timestamp + step > now:
+                # Forming candle, close drifts within the candle period
+                progress = (now - timestamp) / step
+                close = open_ + (close - open_) * progress
+            high = max(open_, close) * (1 + abs(rng.normal(0, 0.001)))
+            low = min(open_, close) * (1 - abs(rng.normal(0, 0.001)))
+            volume = abs(rng.normal(10, 3))
+            candles.append([int(timestamp), open_, high, low, close, volume])
+        return candles
+
+    async def fetch_ohlcv(
+        self, symbol: str, timeframe: str = "1m", since=None, limit=None, params=None
+    ) -> list:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        step = TIMEFRAME_MS[timeframe]
+        limit = limit or 500
+        if since is None:
+            now = int(self.clock() * 1000)
+            start = (now // step - limit + 1) * step
+        else:
+            start = -(-since // step) * step  # First candle at or after since
+        return self._candles(symbol, timeframe, start, limit)
+
+    async def close(self):
+        pass
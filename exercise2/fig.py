@@ -1,21 +1,48 @@
-import time
-
 import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
+from plotly.colors import qualitative
+from plotly.subplots import make_subplots
 
+from common.chart_data import chart_times, chart_values
+from common.downsample import downsample
+from common.instrumentation import instrumented, traced
+from processing import align_closes, cross_asset_analytics
 
-# Added st.cache_data decorator to create_figure function to cache the data and improve the performance of the application.
-@st.cache_data
+
+# Indicator column plotted by each line trace of the OHLCV figure, by trace name
+TRACE_COLUMNS = {
+    "EMA 12": "ema_12",
+    "EMA 26": "ema_26",
+    "Upper Band": "upper_band",
+    "Lower Band": "lower_band",
+}
+
+
+def line_x(x: np.ndarray) -> dict:
+    """
+    x of a line trace: evenly spaced candles are placed with x0/dx instead of
+    another copy of the timestamps, which would be most of the payload.
+    """
+    if len(x) > 1 and np.all(np.diff(x) == x[1] - x[0]):
+        return dict(x=None, x0=float(x[0]), dx=float(x[1] - x[0]))
+    return dict(x=x, x0=None, dx=None)
+
+
+# Not cached with st.cache_data: hashing the whole frame on every tick cost more than
+# building the figure and never hit, as the data changes each time. See LiveFigure.
+@traced
 def create_figure(data, ema_12=False, ema_26=False, bollinger=False):
+    # Series go in as typed arrays (see chart_data), timestamps as epoch milliseconds
+    x = chart_times(data["timestamp"])
     fig = go.Figure(
         data=[
             go.Candlestick(
-                x=data["timestamp"],
-                open=data["open"],
-                high=data["high"],
-                low=data["low"],
-                close=data["close"],
+                x=x,
+                open=chart_values(data["open"]),
+                high=chart_values(data["high"]),
+                low=chart_values(data["low"]),
+                close=chart_values(data["close"]),
             )
         ]
     )
@@ -23,20 +50,20 @@ def create_figure(data, ema_12=False, ema_26=False, bollinger=False):
     if ema_12:
         fig.add_trace(
             go.Scatter(
-                x=data["timestamp"], y=data["ema_12"], mode="lines", name="EMA 12"
+                **line_x(x), y=chart_values(data["ema_12"]), mode="lines", name="EMA 12"
             )
         )
     if ema_26:
         fig.add_trace(
             go.Scatter(
-                x=data["timestamp"], y=data["ema_26"], mode="lines", name="EMA 26"
+                **line_x(x), y=chart_values(data["ema_26"]), mode="lines", name="EMA 26"
             )
         )
     if bollinger:
         fig.add_trace(
             go.Scatter(
-                x=data["timestamp"],
-                y=data["upper_band"],
+                **line_x(x),
+                y=chart_values(data["upper_band"]),
                 mode="lines",
                 line=dict(color="lightgray"),
                 name="Upper Band",
@@ -44,8 +71,8 @@ def create_figure(data, ema_12=False, ema_26=False, bollinger=False):
         )
         fig.add_trace(
             go.Scatter(
-                x=data["timestamp"],
-                y=data["lower_band"],
+                **line_x(x),
+                y=chart_values(data["lower_band"]),
                 fill="tonexty",
                 mode="lines",
                 line=dict(color="lightgray"),
@@ -54,29 +81,259 @@ def create_figure(data, ema_12=False, ema_26=False, bollinger=False):
         )
 
     fig.update_layout(
-        title="OHLCV Data with Indicators", xaxis_title="Time", yaxis_title="Price"
+        title="OHLCV Data with Indicators",
+        xaxis_title="Time",
+        xaxis_type="date",
+        yaxis_title="Price",
     )
     return fig
 
 
-# Added st.cache_data decorator to create_figure function to cache the data and improve the performance of the application.
-@st.cache_data
-def create_large_data_chart(title: str):
-    # Simulate a complex calculation
-    start_time = time.time()
-    size = 10000
+@traced
+def history_figure(data, title: str):
+    # Stored candles only, the indicators belong to the live chart
+    fig = create_figure(data)
+    fig.update_layout(title=title, xaxis_rangeslider_visible=False)
+    return fig
+
+
+class LiveFigure:
+    """
+    OHLCV figure of a candle buffer that is patched instead of rebuilt.
+    It is identified by a cheap fingerprint (coin, timeframe, candle count, indicator
+    flags, window); while that stays the same, each tick only replaces the
+    still-forming last candle and appends the new ones to the existing traces.
+    """
+
+    def __init__(self, fingerprint, data, max_points, ema_12, ema_26, bollinger):
+        self.fingerprint = fingerprint
+        self.max_points = max_points
+        self.figure = create_figure(data, ema_12, ema_26, bollinger)
+        # Kept as the typed arrays the traces are sent with
+        self.columns = self._typed(data)
+        self.version = None
+
+    @staticmethod
+    def _typed(data):
+        return {
+            column: (
+                chart_times(data[column])
+                if column == "timestamp"
+                else chart_values(data[column])
+            )
+            for column in data.columns
+        }
+
+    @property
+    def last_timestamp(self):
+        if not len(self.columns["timestamp"]):
+            return None
+        return int(self.columns["timestamp"][-1])
+
+    @traced
+    def patch(self, new_data):
+        """
+        Merge candles from the last held timestamp on into the figure.
+        """
+        if new_data.empty:
+            return
+        new_columns = self._typed(new_data)
+        keep = self.columns["timestamp"] < new_columns["timestamp"][0]
+        for column in self.columns:
+            self.columns[column] = np.concatenate(
+                [self.columns[column][keep], new_columns[column]]
+            )[-self.max_points :]
+
+        x = self.columns["timestamp"]
+        with self.figure.batch_update():
+            for trace in self.figure.data:
+                if trace.type == "candlestick":
+                    trace.x = x
+                    trace.open = self.columns["open"]
+                    trace.high = self.columns["high"]
+                    trace.low = self.columns["low"]
+                    trace.close = self.columns["close"]
+                else:
+                    trace.update(line_x(x), y=self.columns[TRACE_COLUMNS[trace.name]])
+
+
+@traced
+def live_figure(
+    cache,
+    fingerprint,
+    buffer,
+    indicator_keys,
+    max_points,
+    ema_12=False,
+    ema_26=False,
+    bollinger=False,
+):
+    """
+    Return the figure for the buffer, kept in `cache` (the session state).
+    It shows the last `max_points` candles.
+    A changed fingerprint rebuilds it, an unchanged buffer version returns it as is,
+    otherwise only the new and updated candles are patched in.
+    """
+    live = cache.get("live_figure")
+    version = buffer.version
+    # The buffer identity is part of the fingerprint, it is new after a cache clear
+    fingerprint = (id(buffer), *fingerprint)
+    if live is None or live.fingerprint != fingerprint:
+        live = LiveFigure(
+            fingerprint,
+            buffer.to_frame(indicator_keys, count=max_points),
+            max_points,
+            ema_12,
+            ema_26,
+            bollinger,
+        )
+        cache["live_figure"] = live
+    elif live.version != version:
+        live.patch(buffer.to_frame(indicator_keys, since=live.last_timestamp))
+    live.version = version
+    return live.figure
+
+
+# Panels of the comparison figure, by analytics key
+COMPARISON_PANELS = {
+    "performance": "Performance (%)",
+    "correlation": "Rolling Correlation to {reference}",
+    "beta": "Rolling Beta to {reference}",
+}
+
+
+class ComparisonFigure:
+    """
+    Performance, rolling correlation and rolling beta of several coins in one
+    figure of three stacked panels, one colour per coin. It is built once per
+    fingerprint (coins, candle count, window); each tick only replaces the arrays
+    of its traces, which is what keeps 20+ coins within the refresh interval.
+    """
+
+    def __init__(self, fingerprint, symbols, reference):
+        self.fingerprint = fingerprint
+        self.versions = None
+        self.heatmap = None
+        self.trace_columns = []
+        titles = [
+            title.format(reference=symbols[reference])
+            for title in COMPARISON_PANELS.values()
+        ]
+        self.figure = make_subplots(
+            rows=len(titles),
+            cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.06,
+            subplot_titles=titles,
+        )
+        traces, rows = [], []
+        for column, symbol in enumerate(symbols):
+            color = qualitative.Alphabet[column % len(qualitative.Alphabet)]
+            for row, key in enumerate(COMPARISON_PANELS, start=1):
+                if key != "performance" and column == reference:
+                    continue  # Always 1 against itself
+                traces.append(
+                    go.Scatter(
+                        mode="lines",
+                        name=symbol,
+                        legendgroup=symbol,
+                        showlegend=row == 1,
+                        line=dict(color=color, width=1),
+                    )
+                )
+                rows.append(row)
+                self.trace_columns.append((key, column))
+        self.figure.add_traces(traces, rows=rows, cols=1)
+        # Timestamps are sent as epoch milliseconds, see chart_data
+        self.figure.update_xaxes(type="date")
+        self.figure.update_layout(title="Coin Comparison", height=800)
+
+    @traced
+    def update(self, timestamps, analytics):
+        timestamps = chart_times(timestamps)
+        with self.figure.batch_update():
+            for trace, (key, column) in zip(self.figure.data, self.trace_columns):
+                trace.update(
+                    line_x(timestamps), y=chart_values(analytics[key][:, column])
+                )
+
+
+@traced
+def correlation_heatmap(symbols, matrix, window):
+    fig = go.Figure(
+        data=go.Heatmap(
+            z=matrix,
+            x=symbols,
+            y=symbols,
+            zmin=-1,
+            zmax=1,
+            colorscale="RdBu",
+            text=np.round(matrix, 2),
+            texttemplate="%{text}",
+        )
+    )
+    fig.update_layout(
+        title=f"Correlation of 1m Returns (last {window} candles)",
+        height=max(400, 25 * len(symbols)),
+        yaxis_autorange="reversed",
+    )
+    return fig
+
+
+@traced
+def comparison_figures(cache, fingerprint, buffers, count, window, reference=0):
+    """
+    Return the comparison figure and correlation heatmap of the coins' candle
+    buffers ({symbol: buffer}), kept in `cache` (the session state). The matrix
+    and analytics are only recomputed when one of the buffers changed.
+    """
+    symbols = list(buffers)
+    comparison = cache.get("comparison_figure")
+    fingerprint = (tuple(id(buffer) for buffer in buffers.values()), *fingerprint)
+    if comparison is None or comparison.fingerprint != fingerprint:
+        comparison = ComparisonFigure(fingerprint, symbols, reference)
+        cache["comparison_figure"] = comparison
+    versions = tuple(buffer.version for buffer in buffers.values())
+    if comparison.versions != versions:
+        timestamps, symbols, closes = align_closes(buffers, count)
+        analytics = cross_asset_analytics(closes, window, reference)
+        comparison.update(timestamps, analytics)
+        comparison.heatmap = correlation_heatmap(
+            symbols, analytics["correlation_matrix"], window
+        )
+        comparison.versions = versions
+    return comparison.figure, comparison.heatmap
+
+
+# Cache the result of the complex calculation separately from the figure, so other
+# visible ranges and sizes only redo the cheap downsampling step
+@instrumented(st.cache_data)
+def calculate_large_data(size: int = 10000):
+    # Simulate a complex calculation, timed by the instrumentation span
     x = np.arange(size)
     y = np.random.random(size) * 100
 
     # Perform some intensive computations to simulate complexity
     z = np.sin(x) ** 2 + np.cos(y) ** 2
     result = np.fft.fft(z)
+    return x, np.abs(result)
+
 
-    elapsed_time = time.time() - start_time
-    print(f"Complex calculation took {elapsed_time:.2f} seconds")
+# Added st.cache_data decorator to create_figure function to cache the data and improve the performance of the application.
+@instrumented(st.cache_data)
+def create_large_data_chart(title: str, x_range=None, max_points=None):
+    """
+    Line chart of the FFT result, the points in x_range (all by default) reduced
+    with LTTB to a few points per pixel. The app shows the prebuilt full-range
+    figure, so zooming in magnifies that sample instead of adding detail.
+    """
+    x, y = calculate_large_data()
+    indices = downsample(x, y, x_range=x_range, max_points=max_points)
 
     # Create a scatter plot
-    fig = go.Figure(data=[go.Scatter(x=x, y=np.abs(result), mode="lines")])
+    fig = go.Figure(
+        data=[go.Scatter(x=x[indices], y=chart_values(y[indices]), mode="lines")]
+    )
     fig.update_layout(
         title=title,
         xaxis_title="Index",
@@ -85,14 +342,25 @@ def create_large_data_chart(title: str):
     return fig
 
 
-# Added st.cache_data decorator to create_figure function to cache the data and improve the performance of the application.
-@st.cache_data
-def create_random_chart(title: str):
-    size = 10000
+@instrumented(st.cache_data)
+def calculate_random_data(title: str, size: int = 10000):
+    # Keyed on the title so each random chart keeps its own data
     x = np.arange(size)
     y = np.random.random(size) * 100
+    return x, y
+
+
+# Added st.cache_data decorator to create_figure function to cache the data and improve the performance of the application.
+@instrumented(st.cache_data)
+def create_random_chart(title: str, x_range=None, max_points=None):
+    """
+    Bar chart of random values. Bars are reduced with min/max per bucket so the
+    extremes stay visible while the payload stays small.
+    """
+    x, y = calculate_random_data(title)
+    indices = downsample(x, y, x_range=x_range, max_points=max_points, method="minmax")
 
     # Create a bar chart
-    fig = go.Figure(data=[go.Bar(x=x, y=y)])
+    fig = go.Figure(data=[go.Bar(x=x[indices], y=chart_values(y[indices]))])
     fig.update_layout(title=title, xaxis_title="Index", yaxis_title="Value")
     return fig
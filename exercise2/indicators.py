@@ -0,0 +1,305 @@
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Column positions in the OHLCV value rows handed to indicators
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+
+class Indicator(ABC):
+    """
+    Base class of the streaming indicators.
+
+    bootstrap() computes the full history once, vectorized. After that update()
+    is called for every candle change in O(1): with is_new=True for a new candle,
+    with is_new=False when the still-forming last candle changed. State is kept as
+    "committed" (all closed candles) plus the pending last candle, so replacing the
+    last candle any number of times gives the same result as seeing it once.
+    """
+
+    name = ""
+    columns: tuple = ()
+
+    @property
+    def key(self) -> str:
+        return self.name
+
+    @abstractmethod
+    def bootstrap(self, timestamps: np.ndarray, values: np.ndarray) -> dict:
+        """
+        Outputs for all candles, {column: array}. Resets the streaming state to
+        the end of these candles.
+        """
+
+    @abstractmethod
+    def update(self, timestamp: int, row: np.ndarray, is_new: bool) -> dict:
+        """
+        Outputs for the new or changed last candle, {column: value}.
+        """
+
+
+class _ExponentialAverage:
+    """
+    Exponentially weighted average with the same recursion as
+    pandas ewm(adjust=False), used as a building block by the indicators below.
+    """
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.committed = None
+        self.current = None
+
+    def bootstrap(self, series: np.ndarray) -> np.ndarray:
+        if not len(series):
+            return np.asarray(series, dtype=float)
+        averages = pd.Series(series).ewm(alpha=self.alpha, adjust=False).mean()
+        averages = averages.to_numpy()
+        self.committed = averages[-2] if len(averages) > 1 else None
+        self.current = averages[-1]
+        return averages
+
+    def update(self, value: float, is_new: bool) -> float:
+        if is_new:
+            self.committed = self.current
+        if self.committed is None or np.isnan(self.committed):
+            self.current = value
+        else:
+            self.current = self.alpha * value + (1 - self.alpha) * self.committed
+        return self.current
+
+
+class EMA(Indicator):
+    """
+    Exponential Moving Average of the close price.
+    """
+
+    name = "ema"
+
+    def __init__(self, span: int = 12):
+        self.span = span
+        self.columns = (f"ema_{span}",)
+        self.average = _ExponentialAverage(alpha=2 / (span + 1))
+
+    @property
+    def key(self) -> str:
+        return f"ema_{self.span}"
+
+    def bootstrap(self, timestamps, values):
+        return {self.columns[0]: self.average.bootstrap(values[:, CLOSE])}
+
+    def update(self, timestamp, row, is_new):
+        return {self.columns[0]: self.average.update(row[CLOSE], is_new)}
+
+
+class BollingerBands(Indicator):
+    """
+    Simple moving average of the close price +/- two rolling standard deviations.
+    The window statistics come from running sums of the closes (shifted by a
+    reference price to avoid cancellation), so each update is O(1).
+    """
+
+    name = "bollinger"
+    columns = ("sma", "stddev", "upper_band", "lower_band")
+
+    def __init__(self, window: int = 20, num_std: float = 2.0):
+        self.window = window
+        self.num_std = num_std
+        self.reference = None
+        self.committed = deque()  # Last window - 1 closed candles, shifted
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        self.current = None
+
+    @property
+    def key(self) -> str:
+        return f"bollinger_{self.window}"
+
+    def _bands(self, sma, stddev):
+        return {
+            "sma": sma,
+            "stddev": stddev,
+            "upper_band": sma + stddev * self.num_std,
+            "lower_band": sma - stddev * self.num_std,
+        }
+
+    def bootstrap(self, timestamps, values):
+        close = pd.Series(values[:, CLOSE])
+        rolling = close.rolling(window=self.window)
+        outputs = self._bands(rolling.mean().to_numpy(), rolling.std().to_numpy())
+        if len(close):
+            self.reference = close.iloc[-1]
+            for value in close.iloc[-self.window : -1]:
+                self._push(value - self.reference)
+            self.current = close.iloc[-1] - self.reference
+        return outputs
+
+    def _push(self, value):
+        self.committed.append(value)
+        self.sum += value
+        self.sum_squares += value * value
+        if len(self.committed) > self.window - 1:
+            oldest = self.committed.popleft()
+            self.sum -= oldest
+            self.sum_squares -= oldest * oldest
+
+    def update(self, timestamp, row, is_new):
+        if self.reference is None:
+            self.reference = row[CLOSE]
+        if is_new and self.current is not None:
+            self._push(self.current)
+        self.current = row[CLOSE] - self.reference
+        count = len(self.committed) + 1
+        if count < self.window:
+            return self._bands(np.nan, np.nan)
+        total = self.sum + self.current
+        squares = self.sum_squares + self.current * self.current
+        variance = max(squares - total * total / count, 0.0) / (count - 1)
+        return self._bands(total / count + self.reference, np.sqrt(variance))
+
+
+class RSI(Indicator):
+    """
+    Relative Strength Index with Wilder smoothing of gains and losses.
+    """
+
+    name = "rsi"
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.columns = (f"rsi_{period}",)
+        self.gains = _ExponentialAverage(alpha=1 / period)
+        self.losses = _ExponentialAverage(alpha=1 / period)
+        self.previous_close = None  # Close of the last closed candle
+        self.current_close = None
+
+    @property
+    def key(self) -> str:
+        return f"rsi_{self.period}"
+
+    @staticmethod
+    def _rsi(gain, loss):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 100 - 100 / (1 + np.asarray(gain) / np.asarray(loss))
+
+    def bootstrap(self, timestamps, values):
+        close = values[:, CLOSE]
+        change = np.diff(close, prepend=close[:1])
+        rsi = self._rsi(
+            self.gains.bootstrap(np.maximum(change, 0.0)),
+            self.losses.bootstrap(np.maximum(-change, 0.0)),
+        )
+        if len(close):
+            rsi[0] = np.nan
+            self.previous_close = close[-2] if len(close) > 1 else close[-1]
+            self.current_close = close[-1]
+        return {self.columns[0]: rsi}
+
+    def update(self, timestamp, row, is_new):
+        close = row[CLOSE]
+        if is_new and self.current_close is not None:
+            self.previous_close = self.current_close
+        if self.previous_close is None:
+            self.previous_close = close
+        self.current_close = close
+        change = close - self.previous_close
+        gain = self.gains.update(max(change, 0.0), is_new)
+        loss = self.losses.update(max(-change, 0.0), is_new)
+        return {self.columns[0]: float(self._rsi(gain, loss))}
+
+
+class MACD(Indicator):
+    """
+    Moving Average Convergence Divergence: fast EMA - slow EMA, its signal EMA and
+    the histogram between the two.
+    """
+
+    name = "macd"
+    columns = ("macd", "macd_signal", "macd_histogram")
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = _ExponentialAverage(alpha=2 / (fast + 1))
+        self.slow = _ExponentialAverage(alpha=2 / (slow + 1))
+        self.signal = _ExponentialAverage(alpha=2 / (signal + 1))
+        self.spans = (fast, slow, signal)
+
+    @property
+    def key(self) -> str:
+        return "macd_{}_{}_{}".format(*self.spans)
+
+    def bootstrap(self, timestamps, values):
+        close = values[:, CLOSE]
+        macd = self.fast.bootstrap(close) - self.slow.bootstrap(close)
+        signal = self.signal.bootstrap(macd)
+        return {"macd": macd, "macd_signal": signal, "macd_histogram": macd - signal}
+
+    def update(self, timestamp, row, is_new):
+        macd = self.fast.update(row[CLOSE], is_new) - self.slow.update(
+            row[CLOSE], is_new
+        )
+        signal = self.signal.update(macd, is_new)
+        return {"macd": macd, "macd_signal": signal, "macd_histogram": macd - signal}
+
+
+class VWAP(Indicator):
+    """
+    Volume Weighted Average Price of the typical price, anchored to the UTC day.
+    """
+
+    name = "vwap"
+    columns = ("vwap",)
+    day_ms = 24 * 60 * 60 * 1000
+
+    def __init__(self):
+        # Sums over the closed candles of the committed day
+        self.committed = (None, 0.0, 0.0)  # (day, price x volume, volume)
+        self.current = None
+
+    def _entry(self, timestamp, row):
+        typical = (row[HIGH] + row[LOW] + row[CLOSE]) / 3
+        return int(timestamp) // self.day_ms, typical * row[VOLUME], row[VOLUME]
+
+    def bootstrap(self, timestamps, values):
+        typical = (values[:, HIGH] + values[:, LOW] + values[:, CLOSE]) / 3
+        day = timestamps // self.day_ms
+        frame = pd.DataFrame(
+            {"day": day, "pv": typical * values[:, VOLUME], "v": values[:, VOLUME]}
+        )
+        sums = frame.groupby("day")[["pv", "v"]].cumsum()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vwap = (sums["pv"] / sums["v"]).to_numpy()
+        if len(frame) > 1:
+            previous = sums.iloc[-2]
+            self.committed = (day[-2], previous["pv"], previous["v"])
+        if len(frame):
+            self.current = self._entry(timestamps[-1], values[-1])
+        return {"vwap": vwap}
+
+    def update(self, timestamp, row, is_new):
+        if is_new and self.current is not None:
+            day, pv, v = self.current
+            committed_day, committed_pv, committed_v = self.committed
+            if day == committed_day:
+                self.committed = (day, committed_pv + pv, committed_v + v)
+            else:
+                self.committed = self.current
+        self.current = self._entry(timestamp, row)
+        day, pv, v = self.current
+        committed_day, committed_pv, committed_v = self.committed
+        if day == committed_day:
+            pv, v = pv + committed_pv, v + committed_v
+        return {"vwap": pv / v if v else np.nan}
+
+
+# Indicators that can be attached to a candle buffer, by name
+INDICATORS = {
+    indicator.name: indicator for indicator in (EMA, BollingerBands, RSI, MACD, VWAP)
+}
+
+
+def make_indicator(name: str, **params) -> Indicator:
+    """
+    Create an indicator from its registered name, e.g. make_indicator("ema", span=26).
+    """
+    return INDICATORS[name](**params)
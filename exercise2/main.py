@@ -2,9 +2,13 @@ import time
 
 import streamlit as st
 
-from data import fetch_binance_ohlcv
-from fig import create_large_data_chart, create_random_chart, create_figure
-from processing import calculate_indicators
+from artifacts import artifacts_ready, load_artifact
+from common import instrumentation
+from data import COINS, load_history
+from fig import comparison_figures, history_figure, live_figure
+from poller import market_data_poller
+from processing import selected_indicators
+from resampler import TIMEFRAMES, timeframe_resampler
 
 # User Experience: Set the page configuration to improve layout and add a favicon
 st.set_page_config(
@@ -20,26 +24,6 @@ st.set_page_config(
 )
 
 
-# Cache the resource of the large data chart generation
-@st.cache_resource
-def generate_large_chart(title: str):
-    """
-    Generate a large data chart with the given title.
-    Cached to improve performance for large data sets.
-    """
-    return create_large_data_chart(title=title)
-
-
-# Cache the resource of random chart generation
-@st.cache_resource
-def generate_random_chart(title: str):
-    """
-    Generate a random chart with the given title.
-    Cached for efficiency.
-    """
-    return create_random_chart(title=title)
-
-
 def dashboard():
     """
     Main dashboard function to display the Streamlit application.
@@ -49,15 +33,18 @@ def dashboard():
     # Sidebar
     with st.sidebar:
         st.title("Filters")
-        coin = st.selectbox(
-            "Select Coin", ["BTC/USDT", "ETH/USDT", "LTC/USDT"], key="coin"
-        )
+        coin = st.selectbox("Select Coin", COINS, key="coin")
+        # "Live" checks the pushed candles twice a second and redraws when they changed
+        frequency_map = {"Live": 0.5, "1 second": 1, "5 seconds": 5, "10 seconds": 10}
         frequency = st.selectbox(
-            "Select Update Frequency",
-            ["1 second", "5 seconds", "10 seconds"],
-            key="frequency",
+            "Select Update Frequency", list(frequency_map), key="frequency"
+        )
+        st.selectbox("Timeframe", TIMEFRAMES, index=0, key="timeframe")
+        st.selectbox("Number of Candles", [100, 500, 1000], index=0, key="candle_count")
+        history_ranges = {"1 day": 1, "1 week": 7, "1 month": 30, "3 months": 90}
+        history_range = st.selectbox(
+            "History Range", list(history_ranges), index=2, key="history_range"
         )
-        frequency_map = {"1 second": 1, "5 seconds": 5, "10 seconds": 10}
         st.title("Indicators")
         show_ema_12 = st.checkbox("Show EMA 12", value=True, key="show_ema_12")
         show_ema_26 = st.checkbox("Show EMA 26", value=True, key="show_ema_26")
@@ -68,15 +55,37 @@ def dashboard():
             "Bollinger Bands Window", 10, 50, 10, key="bollinger_window"
         )
 
+        st.title("Comparison")
+        st.multiselect(
+            "Compare Coins",
+            COINS,
+            default=[],
+            key="compare_coins",
+            help=f"Compared with each other and against {COINS[0]}",
+        )
+        st.slider(
+            "Correlation Window",
+            10,
+            240,
+            60,
+            key="correlation_window",
+            help="At most the number of candles minus one",
+        )
+
         with st.popover(label="About", help="Information about filters"):
             st.write(
                 """
                 - **Select Coin**: Choose a coin pair to display the OHLCV chart.
-                - **Select Update Frequency**: Choose the frequency to update the OHLCV chart.
+                - **Select Update Frequency**: Choose the frequency to update the OHLCV chart, "Live" shows each pushed update.
+                - **Timeframe**: Choose the candle length, built from the 1m candles.
+                - **Number of Candles**: Choose how many of the latest candles the chart shows.
+                - **History Range**: Choose how far back the history chart goes.
                 - **Show EMA 12**: Display the Exponential Moving Average with a window of 12.
                 - **Show EMA 26**: Display the Exponential Moving Average with a window of 26.
                 - **Show Bollinger Bands**: Display the Bollinger Bands.
                 - **Bollinger Bands Window**: Choose the window size for the Bollinger Bands.
+                - **Compare Coins**: Show the performance, correlation and beta of several coins.
+                - **Correlation Window**: Number of 1m candles of the rolling correlation and beta, at most the number of candles minus one.
                 """
             )
 
@@ -86,24 +95,23 @@ def dashboard():
         fetch_info_placeholder = st.empty()
         message_placeholder = st.empty()
 
-        # Display a warning about the calculation time
-        message_placeholder.warning(
-            "Please wait, the initial calculations may take some time..."
-        )
-        with st.spinner("Calculating..."):
-            # Display the large data chart first (cached)
-            large_data_fig = generate_large_chart(
-                title="Complex Calculation Result (FFT)"
+        # Heavy charts are prebuilt at deploy time, only warn when they still need building
+        if not artifacts_ready():
+            message_placeholder.warning(
+                "Please wait, the initial calculations may take some time..."
             )
+        with st.spinner("Calculating..."):
+            # Display the large data chart first (prebuilt artifact)
+            large_data_fig = load_artifact("large_chart")
             plot_placeholder.plotly_chart(large_data_fig)
             # time.sleep(3)
 
-            # Display additional random charts (cached)
-            random_chart_1 = generate_random_chart(title="Random Chart 1")
+            # Display additional random charts (prebuilt artifacts)
+            random_chart_1 = load_artifact("random_chart_1")
             plot_placeholder.plotly_chart(random_chart_1, key="random_chart_1")
             # time.sleep(3)
 
-            random_chart_2 = generate_random_chart(title="Random Chart 2")
+            random_chart_2 = load_artifact("random_chart_2")
             plot_placeholder.plotly_chart(random_chart_2, key="random_chart_2")
             # time.sleep(3)
 
@@ -113,29 +121,144 @@ def dashboard():
         )
 
         # Define the fragment function for real-time chart updates
-        @st.fragment(run_every=f"{frequency_map[st.session_state['frequency']]}s")
+        @st.fragment(run_every=frequency_map[st.session_state["frequency"]])
         def update_real_time_chart():
-            # Fetch OHLCV data
-            data = fetch_binance_ohlcv(st.session_state["coin"])
-            data = calculate_indicators(
-                data,
-                ema_12=st.session_state["show_ema_12"],
-                ema_26=st.session_state["show_ema_26"],
-                bollinger=st.session_state["show_bollinger"],
-                window=st.session_state["bollinger_window"],
+            # Each tick is traced on its own, ?debug=1 shows it under the chart
+            with instrumentation.run("fragment"):
+                draw_real_time_chart()
+            instrumentation.debug_panel(st.container())
+
+        def draw_real_time_chart():
+            # Read the buffer kept up to date by the shared background poller,
+            # sessions never request the exchange themselves
+            poller = market_data_poller(st.session_state["coin"], "1m")
+            buffer = poller.subscribe()
+            # Longer timeframes are resampled from the same 1m candles
+            timeframe = st.session_state["timeframe"]
+            if timeframe != "1m":
+                buffer = timeframe_resampler(
+                    st.session_state["coin"], timeframe
+                ).update()
+            if poller.error is not None:
+                fetch_info_placeholder.error(
+                    f"Error fetching data: {str(poller.error)}"
+                )
+                if not len(buffer):
+                    return
+            # Indicators are attached once per buffer and then updated incrementally
+            indicator_keys = [
+                buffer.add_indicator(indicator)
+                for indicator in selected_indicators(
+                    ema_12=st.session_state["show_ema_12"],
+                    ema_26=st.session_state["show_ema_26"],
+                    bollinger=st.session_state["show_bollinger"],
+                    window=st.session_state["bollinger_window"],
+                )
+            ]
+            fingerprint = (
+                st.session_state["coin"],
+                timeframe,
+                st.session_state["candle_count"],
+                st.session_state["show_ema_12"],
+                st.session_state["show_ema_26"],
+                st.session_state["show_bollinger"],
+                st.session_state["bollinger_window"],
             )
-            fig = create_figure(
-                data,
+            # Without a new candle update the placeholder keeps the last chart, the
+            # figure is neither patched nor serialized and sent again
+            drawn = (id(buffer), buffer.version, fingerprint)
+            if st.session_state.get("live_chart_drawn") == drawn:
+                return
+            fig = live_figure(
+                st.session_state,
+                fingerprint=fingerprint,
+                buffer=buffer,
+                indicator_keys=indicator_keys,
+                max_points=st.session_state["candle_count"],
                 ema_12=st.session_state["show_ema_12"],
                 ema_26=st.session_state["show_ema_26"],
                 bollinger=st.session_state["show_bollinger"],
             )
-            plot_placeholder.plotly_chart(fig)
+            with instrumentation.span("fig.render"):
+                plot_placeholder.plotly_chart(fig)
+            st.session_state["live_chart_drawn"] = drawn
             fetch_info_placeholder.info(f"Chart updated at {time.strftime('%H:%M:%S')}")
 
+        # A full rerun starts from empty placeholders, so the charts are always drawn
+        st.session_state["live_chart_drawn"] = None
+        st.session_state["comparison_drawn"] = None
+        comparison_placeholder = st.empty()
+        heatmap_placeholder = st.empty()
+
         # Call the fragment function
         update_real_time_chart()
 
+        @st.fragment(run_every=frequency_map[st.session_state["frequency"]])
+        def update_comparison_chart():
+            with instrumentation.run("comparison_fragment"):
+                draw_comparison_chart()
+
+        def draw_comparison_chart():
+            # The reference coin first, then the selection, all from the shared pollers
+            symbols = list(
+                dict.fromkeys([COINS[0], *st.session_state["compare_coins"]])
+            )
+            pollers = [market_data_poller(symbol, "1m") for symbol in symbols]
+            buffers = {
+                symbol: poller.subscribe() for symbol, poller in zip(symbols, pollers)
+            }
+            errors = [
+                f"{symbol}: {poller.error}"
+                for symbol, poller in zip(symbols, pollers)
+                if poller.error is not None
+            ]
+            if errors:
+                st.warning("Error fetching data: " + ", ".join(errors))
+            # A window longer than the returns of the shown candles is all NaN
+            window = min(
+                st.session_state["correlation_window"],
+                st.session_state["candle_count"] - 1,
+            )
+            fingerprint = (tuple(symbols), st.session_state["candle_count"], window)
+            drawn = (
+                tuple((id(buffer), buffer.version) for buffer in buffers.values()),
+                fingerprint,
+            )
+            if st.session_state.get("comparison_drawn") == drawn:
+                return
+            comparison, heatmap = comparison_figures(
+                st.session_state,
+                fingerprint=fingerprint,
+                buffers=buffers,
+                count=st.session_state["candle_count"],
+                window=window,
+            )
+            with instrumentation.span("fig.render"):
+                comparison_placeholder.plotly_chart(comparison, key="comparison_chart")
+                heatmap_placeholder.plotly_chart(heatmap, key="correlation_heatmap")
+            st.session_state["comparison_drawn"] = drawn
+
+        if st.session_state["compare_coins"]:
+            update_comparison_chart()
+
+        # Backfilled history from the local candle store, no exchange requests
+        coin = st.session_state["coin"]
+        history, resolution = load_history(coin, history_ranges[history_range])
+        if history.empty:
+            st.info(
+                f"No history stored for {coin} yet, "
+                f"run `python backfill.py {coin} --days 90` to backfill it."
+            )
+        else:
+            with instrumentation.span("fig.render"):
+                st.plotly_chart(
+                    history_figure(
+                        history, title=f"{coin} History ({resolution} candles)"
+                    ),
+                    key="history_chart",
+                )
+
 
 if __name__ == "__main__":
-    dashboard()
+    with instrumentation.run("rerun"):
+        dashboard()
@@ -0,0 +1,214 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+from websockets.asyncio.client import connect
+
+from buffer import CandleBuffer
+from common.instrumentation import instrumented
+from data import EXCHANGE_ID, candle_store, exchange_client, update_candle_buffer
+from fake_exchange import FakeExchange
+from stream import BINANCE_STREAM_URL, FakeStreamServer, kline_url, parse_kline
+
+# Candles held per (symbol, timeframe), the chart shows a window of these
+BUFFER_CAPACITY = 1000
+# Seconds between two upstream requests, matches the fastest refresh in the UI
+POLL_INTERVAL = 1.0
+# Polling pauses when no session has read the buffer for this many seconds
+IDLE_TIMEOUT = 60.0
+# "stream" pushes candle updates over the exchange's WebSocket kline stream,
+# "poll" requests them every POLL_INTERVAL; only Binance (and fake) can stream
+LIVE_FEED = os.environ.get("LIVE_FEED", "stream")
+# Seconds before reconnecting a dropped stream, doubled up to the maximum
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+# Streamed candles are written to the store when a candle closes, or after this
+# many seconds for the forming one
+PERSIST_INTERVAL = 5.0
+
+
+class MarketDataPoller:
+    """
+    Background thread keeping one shared CandleBuffer up to date for a
+    (symbol, timeframe). Sessions subscribe and read the buffer instead of
+    requesting the exchange themselves, so the upstream request rate depends on
+    the number of distinct symbols being watched, not on the number of viewers.
+    With a `store`, the polled candles are also written to the candle history.
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        timeframe: str = "1m",
+        client=None,
+        capacity: int = BUFFER_CAPACITY,
+        interval: float = POLL_INTERVAL,
+        idle_timeout: float = IDLE_TIMEOUT,
+        store=None,
+    ):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.client = client
+        self.buffer = CandleBuffer(capacity=capacity)
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.store = store
+        self.error: Exception | None = None
+        self.last_read = time.monotonic()
+        self._ready = threading.Event()
+        self._wake_up = threading.Event()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name=f"poller-{symbol}-{timeframe}", daemon=True
+        )
+        self.thread.start()
+
+    def _idle(self) -> bool:
+        return time.monotonic() - self.last_read > self.idle_timeout
+
+    def _wait_for_subscriber(self):
+        self._wake_up.wait()
+        self._wake_up.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._idle():
+                # Nobody is watching, wait for the next subscriber
+                self._wait_for_subscriber()
+                continue
+            try:
+                update_candle_buffer(
+                    self.buffer,
+                    self.symbol,
+                    self.timeframe,
+                    client=self.client,
+                    on_page=self._persist,
+                )
+                self.error = None
+            except Exception as e:
+                self.error = e
+            self._ready.set()
+            self._stop.wait(self.interval)
+
+    def _persist(self, since: int | None):
+        # The updated forming candle and the new ones, from the last held one on
+        if self.store is None:
+            return
+        with self.buffer.lock:
+            if since is None:
+                positions = self.buffer.positions()
+            else:
+                positions = self.buffer.tail_positions(since)
+            rows = np.column_stack(
+                [self.buffer.timestamps[positions], self.buffer.values[positions]]
+            )
+        try:
+            self.store.write(EXCHANGE_ID, self.symbol, self.timeframe, rows)
+        except sqlite3.Error:
+            # The history is best effort, a locked or full disk must not stop the chart
+            pass
+
+    def subscribe(self, timeout: float = 10.0) -> CandleBuffer:
+        """
+        Mark the buffer as being watched and return it. The first call waits
+        up to `timeout` seconds for the initial fill.
+        """
+        self.last_read = time.monotonic()
+        self._wake_up.set()
+        self._ready.wait(timeout)
+        return self.buffer
+
+    def stop(self):
+        self._stop.set()
+        self._wake_up.set()
+
+
+class MarketDataStream(MarketDataPoller):
+    """
+    MarketDataPoller fed by a WebSocket kline stream instead of polling: candle
+    updates are pushed as trades happen, sub-second and without a request each.
+    The buffer is filled over REST when the stream (re)connects, which also closes
+    any gap left by a dropped connection. The stream is closed while nobody watches.
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        timeframe: str = "1m",
+        url: str = BINANCE_STREAM_URL,
+        **kwargs,
+    ):
+        self.url = kline_url(url, symbol, timeframe)
+        self._persisted = (None, 0.0)  # Last persisted timestamp and when
+        super().__init__(symbol, timeframe, **kwargs)
+
+    def _run(self):
+        asyncio.run(self._consume())
+
+    async def _consume(self):
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            if self._idle():
+                await asyncio.to_thread(self._wait_for_subscriber)
+                continue
+            try:
+                await asyncio.to_thread(self._catch_up)
+                async with connect(self.url, open_timeout=10) as connection:
+                    self.error = None
+                    delay = RECONNECT_DELAY
+                    await self._receive(connection)
+            except Exception as e:
+                self.error = e
+                self._ready.set()
+                await asyncio.to_thread(self._stop.wait, delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _catch_up(self):
+        # Pages through everything missed while the stream was closed, however long
+        update_candle_buffer(
+            self.buffer,
+            self.symbol,
+            self.timeframe,
+            client=self.client,
+            on_page=self._persist,
+        )
+        self._persisted = (self.buffer.last_timestamp, time.monotonic())
+        self._ready.set()
+
+    async def _receive(self, connection):
+        while not self._stop.is_set() and not self._idle():
+            try:
+                message = await asyncio.wait_for(connection.recv(), timeout=1.0)
+            except TimeoutError:
+                continue  # Checks for stop and idleness at least every second
+            row = parse_kline(message)
+            if row is None:
+                continue
+            appended = self.buffer.extend([row])
+            since, persisted_at = self._persisted
+            if appended or time.monotonic() - persisted_at > PERSIST_INTERVAL:
+                self._persist(since)
+                self._persisted = (row[0], time.monotonic())
+
+
+# Local stand-in for the exchange's WebSocket streams when EXCHANGE_ID=fake
+@st.cache_resource
+def fake_stream_server() -> FakeStreamServer:
+    return FakeStreamServer(FakeExchange(latency=0))
+
+
+# One poller (or stream) per (symbol, timeframe) for the whole server process
+@instrumented(st.cache_resource)
+def market_data_poller(symbol: str, timeframe: str = "1m") -> MarketDataPoller:
+    kwargs = dict(client=exchange_client(), store=candle_store())
+    if LIVE_FEED == "stream" and EXCHANGE_ID == "fake":
+        return MarketDataStream(
+            symbol, timeframe, url=fake_stream_server().url, **kwargs
+        )
+    if LIVE_FEED == "stream" and EXCHANGE_ID == "binance":
+        return MarketDataStream(symbol, timeframe, **kwargs)
+    return MarketDataPoller(symbol, timeframe, **kwargs)
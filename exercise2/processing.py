@@ -1,11 +1,161 @@
-def calculate_indicators(data, ema_12=False, ema_26=False, bollinger=False, window=20):
+import numpy as np
+
+from common.instrumentation import traced
+from fake_exchange import TIMEFRAME_MS
+from indicators import EMA, BollingerBands, Indicator
+
+
+def selected_indicators(
+    ema_12=False, ema_26=False, bollinger=False, window=20
+) -> list[Indicator]:
+    """
+    Return fresh indicator instances for the options selected in the sidebar.
+    """
+    indicators = []
     if ema_12:
-        data["ema_12"] = data["close"].ewm(span=12, adjust=False).mean()
+        indicators.append(EMA(span=12))
     if ema_26:
-        data["ema_26"] = data["close"].ewm(span=26, adjust=False).mean()
+        indicators.append(EMA(span=26))
     if bollinger:
-        data["sma"] = data["close"].rolling(window=window).mean()
-        data["stddev"] = data["close"].rolling(window=window).std()
-        data["upper_band"] = data["sma"] + (data["stddev"] * 2)
-        data["lower_band"] = data["sma"] - (data["stddev"] * 2)
+        indicators.append(BollingerBands(window=window))
+    return indicators
+
+
+@traced
+def calculate_indicators(data, ema_12=False, ema_26=False, bollinger=False, window=20):
+    """
+    Full-history calculation of the selected indicators. Works on a copy, the
+    input may be a cached st.cache_data value that must not be mutated.
+    Live charts use the incremental indicators attached to the candle buffer.
+    """
+    data = data.copy()
+    indicators = selected_indicators(ema_12, ema_26, bollinger, window)
+    if not indicators:
+        return data
+    timestamps = data["timestamp"].to_numpy().astype("datetime64[ms]").astype("int64")
+    values = data[["open", "high", "low", "close", "volume"]].to_numpy(dtype=float)
+    for indicator in indicators:
+        for column, column_values in indicator.bootstrap(timestamps, values).items():
+            data[column] = column_values
     return data
+
+
+def resample_candles(
+    timestamps: np.ndarray, values: np.ndarray, step: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Aggregate time-ordered candles into candles of `step` milliseconds: first
+    open, highest high, lowest low, last close and summed volume per period.
+    """
+    if not len(timestamps):
+        return timestamps, values
+    periods = timestamps // step * step
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    ends = np.r_[starts[1:], len(periods)] - 1
+    resampled = np.column_stack(
+        [
+            values[starts, 0],
+            np.maximum.reduceat(values[:, 1], starts),
+            np.minimum.reduceat(values[:, 2], starts),
+            values[ends, 3],
+            np.add.reduceat(values[:, 4], starts),
+        ]
+    )
+    return periods[starts], resampled
+
+
+def history_timeframe(span: int, max_candles: int) -> str:
+    """
+    Shortest timeframe showing `span` milliseconds of history in at most
+    `max_candles` candles.
+    """
+    for timeframe, step in TIMEFRAME_MS.items():
+        if span / step <= max_candles:
+            return timeframe
+    return timeframe
+
+
+@traced
+def align_closes(buffers: dict, count: int, step: int = TIMEFRAME_MS["1m"]):
+    """
+    Close prices of several candle buffers ({symbol: buffer}) on one grid of the
+    last `count` periods up to the newest candle of any of them: a timestamp x
+    symbol matrix, forward filled, NaN before a symbol's first candle.
+    """
+    symbols = list(buffers)
+    snapshots = []
+    for symbol in symbols:
+        buffer = buffers[symbol]
+        with buffer.lock:
+            positions = buffer.positions()[-count:]
+            snapshots.append(
+                (buffer.timestamps[positions].copy(), buffer.values[positions, 3])
+            )
+    end = max(
+        (snapshot[0][-1] for snapshot in snapshots if len(snapshot[0])), default=0
+    )
+    timestamps = end - step * np.arange(count - 1, -1, -1, dtype=np.int64)
+    closes = np.full((count, len(symbols)), np.nan)
+    for column, (candle_timestamps, candle_closes) in enumerate(snapshots):
+        rows = (candle_timestamps - timestamps[0]) // step
+        inside = rows >= 0
+        closes[rows[inside], column] = candle_closes[inside]
+    # Forward fill down each column: index of the last filled row at every row
+    filled = np.where(np.isnan(closes), 0, np.arange(count)[:, None])
+    np.maximum.accumulate(filled, axis=0, out=filled)
+    closes = closes[filled, np.arange(len(symbols))]
+    return timestamps, symbols, closes
+
+
+def _rolling_sums(values: np.ndarray, window: int) -> np.ndarray:
+    # Sum over the last `window` rows at every row, from one cumulative sum
+    sums = np.cumsum(values, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums
+
+
+@traced
+def cross_asset_analytics(closes: np.ndarray, window: int, reference: int = 0) -> dict:
+    """
+    Vectorized analytics of a timestamp x symbol close matrix: performance since
+    the first close in percent, rolling correlation and beta of the log returns
+    against the `reference` column over `window` periods, and the correlation
+    matrix of the last `window` returns. Rolling values come from windowed
+    cumulative sums, O(timestamps x symbols) whatever the window.
+    """
+    first = closes[np.argmax(~np.isnan(closes), axis=0), np.arange(closes.shape[1])]
+    performance = (closes / first - 1) * 100
+
+    returns = np.diff(np.log(closes), axis=0, prepend=np.nan)
+    x = returns
+    y = returns[:, [reference]]
+    valid = np.isfinite(x) & np.isfinite(y)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    n = _rolling_sums(valid.astype(float), window)
+    sum_x = _rolling_sums(x, window)
+    sum_y = _rolling_sums(y, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = _rolling_sums(x * y, window) / n - sum_x * sum_y / n**2
+        variance_x = _rolling_sums(x * x, window) / n - (sum_x / n) ** 2
+        variance_y = _rolling_sums(y * y, window) / n - (sum_y / n) ** 2
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+        beta = covariance / variance_y
+    too_few = n < max(window // 2, 3)
+    correlation[too_few] = np.nan
+    beta[too_few] = np.nan
+
+    recent = returns[-window:]
+    recent = recent[np.isfinite(recent).all(axis=1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matrix = (
+            np.corrcoef(recent, rowvar=False)
+            if len(recent) > 2
+            else np.full((closes.shape[1],) * 2, np.nan)
+        )
+    return {
+        "performance": performance,
+        "correlation": np.clip(correlation, -1, 1),
+        "beta": beta,
+        "correlation_matrix": np.atleast_2d(matrix),
+    }
@@ -7,3 +7,260 @@ Suggestions:
 - indexing
 -
 """
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from buffer import OHLCV_COLUMNS
+from fake_exchange import TIMEFRAME_MS
+
+# SQLite file of the candle history, filled by backfill.py
+CANDLE_STORE_PATH = os.environ.get(
+    "CANDLE_STORE_PATH", os.path.join(os.path.dirname(__file__), "crypto.db")
+)
+# Candles per partition: one day of 1m candles, 60 days of 1h candles
+PARTITION_CANDLES = 1440
+
+# Candles are stored per time partition, one row holding the partition's candles
+# as packed arrays. A range read of months of 1m candles then fetches a few hundred
+# rows instead of hundreds of thousands. The primary key (exchange, symbol,
+# timeframe, start) is the timestamp index of the table.
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS candle_partitions (
+    exchange TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    first_timestamp INTEGER NOT NULL,
+    last_timestamp INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    timestamps BLOB NOT NULL,
+    ohlcv BLOB NOT NULL,
+    PRIMARY KEY (exchange, symbol, timeframe, start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS backfill_state (
+    exchange TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    cursor INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (exchange, symbol, timeframe)
+);
+"""
+
+SELECT_PARTITIONS = """
+SELECT timestamps, ohlcv FROM candle_partitions
+WHERE exchange = ? AND symbol = ? AND timeframe = ? AND start >= ? AND start <= ?
+ORDER BY start
+"""
+
+SELECT_PARTITION = """
+SELECT timestamps, ohlcv FROM candle_partitions
+WHERE exchange = ? AND symbol = ? AND timeframe = ? AND start = ?
+"""
+
+UPSERT_PARTITION = """
+INSERT OR REPLACE INTO candle_partitions
+    (exchange, symbol, timeframe, start, first_timestamp, last_timestamp, count,
+     timestamps, ohlcv)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SELECT_COVERAGE = """
+SELECT MIN(first_timestamp), MAX(last_timestamp), SUM(count) FROM candle_partitions
+WHERE exchange = ? AND symbol = ? AND timeframe = ?
+"""
+
+DELETE_OLD_PARTITIONS = """
+DELETE FROM candle_partitions
+WHERE exchange = ? AND symbol = ? AND timeframe = ? AND last_timestamp < ?
+"""
+
+SELECT_BACKFILL_STATE = """
+SELECT start, cursor FROM backfill_state
+WHERE exchange = ? AND symbol = ? AND timeframe = ?
+"""
+
+UPSERT_BACKFILL_STATE = """
+INSERT OR REPLACE INTO backfill_state
+    (exchange, symbol, timeframe, start, cursor, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def partition_span(timeframe: str) -> int:
+    """
+    Milliseconds covered by one partition of the timeframe.
+    """
+    return PARTITION_CANDLES * TIMEFRAME_MS[timeframe]
+
+
+class CandleStore:
+    """
+    Local OHLCV history keyed by (exchange, symbol, timeframe), partitioned by
+    time. Writes merge into the partitions they touch (a candle already stored is
+    replaced), reads return the candles of a time range as NumPy arrays.
+    Safe to use from several threads and processes.
+    """
+
+    def __init__(self, path: str = CANDLE_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(CREATE_TABLES)
+            self._local.connection = connection
+        return connection
+
+    def write(
+        self,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        ohlcv: list,
+        cursor: tuple[int, int] | None = None,
+    ) -> int:
+        """
+        Store candles given as [timestamp, open, high, low, close, volume] rows.
+        `cursor` = (start, cursor) is saved as the backfill state in the same
+        transaction, so an interrupted backfill resumes after the last stored page.
+        Returns the number of candles written.
+        """
+        connection = self._connection()
+        key = (exchange, symbol, timeframe)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if len(ohlcv):
+                rows = np.asarray(ohlcv, dtype=np.float64)
+                timestamps = rows[:, 0].astype(np.int64)
+                span = partition_span(timeframe)
+                starts = timestamps // span * span
+                for start in np.unique(starts):
+                    in_partition = starts == start
+                    self._merge(
+                        connection,
+                        key,
+                        int(start),
+                        timestamps[in_partition],
+                        rows[in_partition, 1:],
+                    )
+            if cursor is not None:
+                connection.execute(UPSERT_BACKFILL_STATE, (*key, *cursor, time.time()))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return len(ohlcv)
+
+    @staticmethod
+    def _merge(
+        connection: sqlite3.Connection,
+        key: tuple,
+        start: int,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+    ):
+        row = connection.execute(SELECT_PARTITION, (*key, start)).fetchone()
+        if row is not None:
+            stored_timestamps, stored_values = _unpack(*row)
+            timestamps = np.concatenate([stored_timestamps, timestamps])
+            values = np.concatenate([stored_values, values])
+        # Keep the last written row of each timestamp, in time order
+        unique, reversed_first = np.unique(timestamps[::-1], return_index=True)
+        keep = len(timestamps) - 1 - reversed_first
+        values = values[keep]
+        connection.execute(
+            UPSERT_PARTITION,
+            (
+                *key,
+                start,
+                int(unique[0]),
+                int(unique[-1]),
+                len(unique),
+                unique.astype(np.int64).tobytes(),
+                np.ascontiguousarray(values, dtype=np.float64).tobytes(),
+            ),
+        )
+
+    def read(
+        self,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        start: int | None = None,
+        end: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Timestamps (ms) and OHLCV values of the stored candles with
+        start <= timestamp <= end, in time order.
+        """
+        span = partition_span(timeframe)
+        first = -(2**62) if start is None else start // span * span
+        last = 2**62 if end is None else end
+        rows = (
+            self._connection()
+            .execute(SELECT_PARTITIONS, (exchange, symbol, timeframe, first, last))
+            .fetchall()
+        )
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(OHLCV_COLUMNS)))
+        partitions = [_unpack(*row) for row in rows]
+        timestamps = np.concatenate([partition[0] for partition in partitions])
+        values = np.concatenate([partition[1] for partition in partitions])
+        lower = 0 if start is None else np.searchsorted(timestamps, start, "left")
+        upper = (
+            len(timestamps)
+            if end is None
+            else np.searchsorted(timestamps, end, "right")
+        )
+        return timestamps[lower:upper], values[lower:upper]
+
+    def coverage(self, exchange: str, symbol: str, timeframe: str) -> tuple:
+        """
+        (first timestamp, last timestamp, number of candles) stored, Nones when empty.
+        """
+        first, last, count = (
+            self._connection()
+            .execute(SELECT_COVERAGE, (exchange, symbol, timeframe))
+            .fetchone()
+        )
+        return first, last, count or 0
+
+    def delete_before(self, exchange: str, symbol: str, timeframe: str, timestamp: int):
+        """
+        Drop the partitions holding only candles older than `timestamp`.
+        """
+        self._connection().execute(
+            DELETE_OLD_PARTITIONS, (exchange, symbol, timeframe, timestamp)
+        )
+
+    def backfill_state(
+        self, exchange: str, symbol: str, timeframe: str
+    ) -> tuple[int, int] | None:
+        """
+        (start, cursor) of the last backfill: candles from start up to the cursor
+        are stored, the next page is fetched from the cursor.
+        """
+        return (
+            self._connection()
+            .execute(SELECT_BACKFILL_STATE, (exchange, symbol, timeframe))
+            .fetchone()
+        )
+
+
+def _unpack(timestamps: bytes, ohlcv: bytes) -> tuple[np.ndarray, np.ndarray]:
+    return (
+        np.frombuffer(timestamps, dtype=np.int64),
+        np.frombuffer(ohlcv, dtype=np.float64).reshape(-1, len(OHLCV_COLUMNS)),
+    )
@@ -0,0 +1,163 @@
+import sqlite3
+import threading
+
+import numpy as np
+import streamlit as st
+
+from buffer import CandleBuffer
+from common.instrumentation import instrumented, traced
+from data import EXCHANGE_ID, candle_store
+from fake_exchange import TIMEFRAME_MS
+from poller import BUFFER_CAPACITY, market_data_poller
+from processing import resample_candles
+from query import CandleStore
+
+# Timeframes offered in the UI, all built from the 1m candles
+TIMEFRAMES = list(TIMEFRAME_MS)
+
+
+class TimeframeResampler:
+    """
+    Keeps a CandleBuffer of higher-timeframe candles in step with a 1m base buffer.
+    The newest bar is the aggregate of its closed 1m candles plus the still-forming
+    1m candle, so each update only folds in the 1m candles that arrived since the
+    last one instead of re-aggregating the history. Older bars come from the 1m
+    candles in the candle store when it holds them, and so do 1m candles the base
+    evicted before an update folded them in.
+    """
+
+    def __init__(
+        self,
+        base: CandleBuffer,
+        timeframe: str,
+        capacity: int = BUFFER_CAPACITY,
+        history: tuple[np.ndarray, np.ndarray] | None = None,
+        store: CandleStore | None = None,
+        symbol: str | None = None,
+    ):
+        self.base = base
+        self.step = TIMEFRAME_MS[timeframe]
+        # Where the 1m candles of the base are persisted, read when some were
+        # evicted from the base before being folded in
+        self.store = store
+        self.symbol = symbol
+        self.buffer = CandleBuffer(capacity=capacity)
+        self.lock = threading.Lock()
+        # [period start, open, high, low, close, volume] of the closed 1m candles
+        # of the newest period
+        self.bar = None
+        # 1m candles from this timestamp on are not folded into the bars yet
+        self.cursor = 0
+        self.base_version = None
+        if history is not None and len(history[0]):
+            self._seed(*history)
+
+    def _seed(self, timestamps: np.ndarray, values: np.ndarray):
+        periods, bars = resample_candles(timestamps, values, self.step)
+        rows = np.column_stack([periods, bars])
+        self.buffer.extend(rows[:-1].tolist())
+        self.bar = rows[-1].tolist()
+        self.cursor = int(timestamps[-1]) + 1
+
+    def _fold(self, timestamp: int, values: np.ndarray, rows: list):
+        period = timestamp // self.step * self.step
+        if self.bar is None or self.bar[0] != period:
+            if self.bar is not None:
+                rows.append(self.bar)
+            self.bar = [period, *values]
+        else:
+            self.bar = _merge(self.bar, values)
+
+    @traced
+    def update(self) -> CandleBuffer:
+        """
+        Fold the 1m candles that arrived since the last update into the bars.
+        Returns the buffer of bars, left untouched when the base did not change.
+        """
+        with self.lock:
+            with self.base.lock:
+                if self.base.version == self.base_version:
+                    return self.buffer
+                self.base_version = self.base.version
+                first = self.base.first_timestamp
+                positions = self.base.tail_positions(self.cursor)
+                timestamps = self.base.timestamps[positions].copy()
+                values = self.base.values[positions].copy()
+            if self.cursor and first is not None and first > self.cursor:
+                # Nobody updated this timeframe for longer than the base holds:
+                # the 1m candles between the cursor and the base are read back
+                missed_timestamps, missed_values = self._read_missed(first)
+                timestamps = np.concatenate([missed_timestamps, timestamps])
+                values = np.concatenate([missed_values, values])
+            if not len(timestamps):
+                return self.buffer
+            rows = []
+            # All but the newest 1m candle are closed: fold them in for good
+            for timestamp, candle in zip(timestamps[:-1], values[:-1]):
+                self._fold(int(timestamp), candle, rows)
+            # The newest one may still change, it is folded in again next time
+            self.cursor = int(timestamps[-1])
+            period = self.cursor // self.step * self.step
+            if self.bar is not None and self.bar[0] == period:
+                rows.append(_merge(self.bar, values[-1]))
+            else:
+                if self.bar is not None:
+                    rows.append(self.bar)
+                rows.append([period, *values[-1]])
+            self.buffer.extend(rows)
+        return self.buffer
+
+    def _read_missed(self, first: int) -> tuple[np.ndarray, np.ndarray]:
+        # Stored 1m candles from the cursor up to the oldest one in the base; none
+        # without a store or when it fails, the bars then skip those candles
+        if self.store is not None:
+            try:
+                return self.store.read(
+                    EXCHANGE_ID, self.symbol, "1m", self.cursor, first - 1
+                )
+            except sqlite3.Error:
+                pass
+        return np.empty(0, dtype=np.int64), np.empty((0, self.base.values.shape[1]))
+
+
+def _merge(bar: list, values: np.ndarray) -> list:
+    # Bar extended with one more 1m candle
+    return [
+        bar[0],
+        bar[1],
+        max(bar[2], values[1]),
+        min(bar[3], values[2]),
+        values[3],
+        bar[5] + values[4],
+    ]
+
+
+def stored_history(
+    store: CandleStore, symbol: str, timeframe: str, before: int | None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Stored 1m candles covering `BUFFER_CAPACITY` bars of the timeframe before
+    `before` (the first candle of the base buffer). The newest stored candle is
+    left out when the base is empty, it may still have been forming.
+    """
+    _, last, _ = store.coverage(EXCHANGE_ID, symbol, "1m")
+    if last is None:
+        return np.empty(0, dtype=np.int64), np.empty((0, 5))
+    end = (last if before is None else before) - 1
+    start = (end // TIMEFRAME_MS[timeframe] - BUFFER_CAPACITY) * TIMEFRAME_MS[timeframe]
+    return store.read(EXCHANGE_ID, symbol, "1m", start, end)
+
+
+# One resampler per (symbol, timeframe) for the whole server process, fed by the
+# shared 1m poller of the symbol: every timeframe costs no extra exchange request
+@instrumented(st.cache_resource)
+def timeframe_resampler(symbol: str, timeframe: str) -> TimeframeResampler:
+    base = market_data_poller(symbol, "1m").subscribe()
+    with base.lock:
+        positions = base.positions()
+        before = int(base.timestamps[positions[0]]) if len(positions) else None
+    store = candle_store()
+    history = stored_history(store, symbol, timeframe, before)
+    return TimeframeResampler(
+        base, timeframe, history=history, store=store, symbol=symbol
+    )
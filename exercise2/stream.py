@@ -0,0 +1,138 @@
+import asyncio
+import json
+import threading
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from fake_exchange import TIMEFRAME_MS, FakeExchange
+
+# Binance kline streams, one connection per (symbol, timeframe)
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/ws"
+# Quote currencies the stand-in server recognises in stream names
+FAKE_QUOTES = ("usdt", "usdc", "btc", "eth")
+
+
+def stream_name(symbol: str, timeframe: str) -> str:
+    # BTC/USDT, 1m -> btcusdt@kline_1m
+    return f"{symbol.replace('/', '').lower()}@kline_{timeframe}"
+
+
+def kline_url(base_url: str, symbol: str, timeframe: str) -> str:
+    return f"{base_url}/{stream_name(symbol, timeframe)}"
+
+
+def parse_kline(message: str | bytes) -> list | None:
+    """
+    Candle row [timestamp, open, high, low, close, volume] of a kline stream
+    message, None for other messages. Updates of the forming candle share its
+    timestamp, so CandleBuffer.extend replaces it in place.
+    """
+    data = json.loads(message)
+    if data.get("e") != "kline":
+        return None
+    kline = data["k"]
+    return [
+        int(kline["t"]),
+        float(kline["o"]),
+        float(kline["h"]),
+        float(kline["l"]),
+        float(kline["c"]),
+        float(kline["v"]),
+    ]
+
+
+def kline_message(symbol: str, timeframe: str, candle: list, closed: bool) -> str:
+    # Kline event in the Binance format, used by the local stand-in server
+    timestamp, open_, high, low, close, volume = candle
+    return json.dumps(
+        {
+            "e": "kline",
+            "s": symbol.replace("/", ""),
+            "k": {
+                "t": timestamp,
+                "T": timestamp + TIMEFRAME_MS[timeframe] - 1,
+                "s": symbol.replace("/", ""),
+                "i": timeframe,
+                "o": str(open_),
+                "h": str(high),
+                "l": str(low),
+                "c": str(close),
+                "v": str(volume),
+                "x": closed,
+            },
+        }
+    )
+
+
+class FakeStreamServer:
+    """
+    Local stand-in for the Binance kline WebSocket streams, serving the candles of
+    a FakeExchange at ws://host:port/ws/<symbol>@kline_<timeframe>. Every
+    `interval` seconds it pushes the forming candle, and the final version of a
+    candle once the next one starts. Runs its own event loop in a daemon thread.
+    """
+
+    def __init__(
+        self,
+        exchange: FakeExchange | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        interval: float = 0.25,
+    ):
+        self.exchange = exchange or FakeExchange(latency=0)
+        self.interval = interval
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            self._start(host, port), self.loop
+        ).result()
+        self.host, self.port = self.server.sockets[0].getsockname()[:2]
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws"
+
+    async def _start(self, host: str, port: int):
+        return await serve(self._handle, host, port)
+
+    @staticmethod
+    def _symbol(stream_id: str) -> str | None:
+        # btcusdt -> BTC/USDT, the FakeExchange candles are seeded by the symbol
+        for quote in FAKE_QUOTES:
+            if stream_id.endswith(quote) and len(stream_id) > len(quote):
+                return f"{stream_id[: -len(quote)]}/{quote}".upper()
+        return None
+
+    def _candle(self, symbol: str, timeframe: str, timestamp: int) -> list:
+        return self.exchange._candles(symbol, timeframe, timestamp, 1)[0]
+
+    async def _handle(self, connection):
+        stream_id, _, timeframe = connection.request.path.rsplit("/", 1)[-1].partition(
+            "@kline_"
+        )
+        symbol = self._symbol(stream_id)
+        if symbol is None or timeframe not in TIMEFRAME_MS:
+            await connection.close(code=1008, reason="unknown stream")
+            return
+        step = TIMEFRAME_MS[timeframe]
+        current = None
+        try:
+            while True:
+                timestamp = self.exchange.milliseconds() // step * step
+                if current is not None and timestamp != current:
+                    candle = self._candle(symbol, timeframe, current)
+                    await connection.send(
+                        kline_message(symbol, timeframe, candle, True)
+                    )
+                current = timestamp
+                candle = self._candle(symbol, timeframe, timestamp)
+                await connection.send(kline_message(symbol, timeframe, candle, False))
+                await asyncio.sleep(self.interval)
+        except ConnectionClosed:
+            pass  # The client went away
+
+    def close(self):
+        self.server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)